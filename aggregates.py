@@ -0,0 +1,150 @@
+import sys
+from datetime import datetime, timezone
+from firestore import (
+    get_db,
+    firestore_api,
+    submission_collections,
+    stream_collection,
+    SECTION_NAMES,
+)
+from batch_writer import submission_writer
+
+# one document per domain holding running counters, so dashboards read O(domains) documents
+AGGREGATES_COLLECTION = "_aggregates"
+
+# numeric submission metrics (see text_metrics.py) summed per domain so averages can be derived
+SUMMED_METRICS = ["word_count", "reading_grade", "you_ratio"]
+
+
+def is_missing(value):
+    '''True if a feedback section was left empty or marked "N/A" by the evaluator.'''
+    value = (value or "").strip()
+    return not value or value.upper().startswith("N/A")
+
+
+def empty_aggregate(domain):
+    return {
+        "domain": domain,
+        "total": 0,
+        "days": {},
+        "sections": {name: {"present": 0, "na": 0} for name in SECTION_NAMES},
+        "metrics": {name: 0 for name in SUMMED_METRICS},
+    }
+
+
+def add_to_aggregate(aggregate, entry, day):
+    '''Counts one submission into an in-memory aggregate.'''
+    aggregate["total"] += 1
+    aggregate["days"][day] = aggregate["days"].get(day, 0) + 1
+
+    feedback = entry.get("feedback", {})
+    for name in SECTION_NAMES:
+        aggregate["sections"][name]["na" if is_missing(feedback.get(name)) else "present"] += 1
+
+    metrics = entry.get("metrics") or {}
+    for name in SUMMED_METRICS:
+        aggregate["metrics"][name] += metrics.get(name, 0) or 0
+
+
+def as_increments(aggregate):
+    '''Converts an in-memory aggregate into a merge-able update of Firestore Increment transforms.'''
+    increment = firestore_api().Increment
+    return {
+        "domain": aggregate["domain"],
+        "total": increment(aggregate["total"]),
+        "days": {day: increment(n) for day, n in aggregate["days"].items()},
+        "sections": {
+            name: {key: increment(n) for key, n in counts.items() if n}
+            for name, counts in aggregate["sections"].items()
+        },
+        "metrics": {name: increment(total) for name, total in aggregate["metrics"].items() if total},
+        "updated_at": firestore_api().SERVER_TIMESTAMP,
+    }
+
+
+def aggregate_batch_hook(client, batch, records):
+    '''Batched-writer hook: adds one counter update per domain to the same batch as the submissions.
+
+    Because the counters commit atomically with the submissions that create their documents (the writer
+    leaves out rewrites of existing ones), they stay consistent with the data.
+    '''
+    today = datetime.now(timezone.utc).date().isoformat()
+    aggregates = {}
+
+    for record in records:
+        domain = record["collection"]
+        if domain.startswith("_") or "feedback" not in record["data"]:
+            continue
+        if domain not in aggregates:
+            aggregates[domain] = empty_aggregate(domain)
+        add_to_aggregate(aggregates[domain], record["data"], today)
+
+    for domain, aggregate in aggregates.items():
+        batch.set(client.collection(AGGREGATES_COLLECTION).document(domain), as_increments(aggregate), merge=True)
+
+
+def load_aggregate(domain):
+    '''Grabs one domain's aggregate document, or an empty dict if none exists.'''
+    snapshot = get_db().collection(AGGREGATES_COLLECTION).document(domain).get()
+    return snapshot.to_dict() if snapshot.exists else {}
+
+
+def load_aggregates():
+    '''Grabs every per-domain aggregate document.'''
+    return [doc.to_dict() for doc in get_db().collection(AGGREGATES_COLLECTION).stream()]
+
+
+def summarize_aggregate(aggregate, days=None):
+    '''Turns a stored aggregate into dashboard numbers: totals, recent daily counts, N/A rates and averages.'''
+    total = aggregate.get("total", 0)
+    daily = dict(sorted(aggregate.get("days", {}).items()))
+    if days:
+        daily = dict(list(daily.items())[-days:])
+
+    sections = {}
+    for name, counts in aggregate.get("sections", {}).items():
+        seen = counts.get("present", 0) + counts.get("na", 0)
+        sections[name] = {"na_rate": round(counts.get("na", 0) / seen, 3) if seen else None, **counts}
+
+    metrics = aggregate.get("metrics", {})
+    averages = {f"avg_{name}": round(metrics.get(name, 0) / total, 3) if total else None for name in SUMMED_METRICS}
+
+    updated_at = aggregate.get("updated_at")
+    return {
+        "domain": aggregate.get("domain"),
+        "total": total,
+        "daily": daily,
+        "sections": sections,
+        **averages,
+        "updated_at": updated_at.isoformat() if hasattr(updated_at, "isoformat") else None,
+    }
+
+
+def backfill_aggregates():
+    '''Rebuilds every domain aggregate from the stored submissions, overwriting the current counters.
+
+    Run it when live traffic is quiet: submissions written during the scan are counted by the
+    live hook but then overwritten by the backfill totals.
+    '''
+    rebuilt = 0
+    for col in submission_collections():
+        aggregate = empty_aggregate(col.id)
+        for entry in stream_collection(col):
+            timestamp = entry.get("submitted_at")
+            day = timestamp.date().isoformat() if hasattr(timestamp, "date") else "unknown"
+            add_to_aggregate(aggregate, entry, day)
+
+        aggregate["updated_at"] = datetime.now(timezone.utc)
+        get_db().collection(AGGREGATES_COLLECTION).document(col.id).set(aggregate)
+        rebuilt += 1
+        print(f"Backfilled {col.id}: {aggregate['total']} submissions")
+    return rebuilt
+
+
+submission_writer.add_batch_hook(aggregate_batch_hook)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("Usage: python aggregates.py backfill")
+    backfill_aggregates()
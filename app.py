@@ -1,19 +1,53 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, Response
+from flask import Flask, request, jsonify, render_template, redirect, url_for, session, Response, stream_with_context
 from model import (
-    build_system_prompt,
-    build_fallback_system_prompt,
     get_completion_from_messages,
-    is_valid_pitch,
-    summarize_feedback,
+    stream_completion_from_messages,
+    create_completion_with_fallback,
+    structured_request,
+    response_text,
+    classify_with_llm,
 )
-from firestore import save_submission, fetch_all_submissions
+from firestore import (
+    save_submission,
+    stream_all_submissions,
+    submission_collections,
+    fetch_submissions_page,
+    get_domain,
+    INTERNAL_PREFIX,
+)
+from summary import refresh_weakness_summary, get_cached_summary
+from cache import clean_cache, make_cache_key, SingleFlight
+from classifier import local_classifier
+from text_metrics import compute_text_metrics
+from prompts import prompt_store, JUDGED_SECTIONS
+from batch_writer import submission_writer
+from scheduler import scheduler
+from aggregates import load_aggregate, load_aggregates, summarize_aggregate
+from feedback_parser import parse_stats
+from dedup import submission_index
+from ratelimit import rate_limiter
+from export import stream_export, pyarrow_available, EXPORT_FORMATS
+from bulk import parse_pitches, run_bulk, submit_openai_batch, collect_openai_batch, BULK_CONCURRENCY
+from jobs import job_queue, FINISHED
+import metrics
+from metrics import stage, bind
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 import os
 import csv
+import json
+import math
+import uuid
+import base64
+import hashlib
+import atexit
+import threading
 import traceback
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "fallback_secret")
+metrics.init_app(app)
 
 admin_emails = [
     email.strip().lower()
@@ -21,8 +55,29 @@ admin_emails = [
     if email.strip()
 ]
 
-system_prompt = build_system_prompt()
-fallback_system_prompt = build_fallback_system_prompt()
+# run gpt-4 grading concurrently with classification (set SPECULATIVE_EVALUATION=0 to disable)
+speculative_evaluation = os.getenv("SPECULATIVE_EVALUATION", "1") == "1"
+model_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MODEL_WORKERS", "8")))
+
+# /chat queues messages for the job workers and returns a job id to poll (CHAT_JOB_QUEUE=1). Only enable it
+# where worker threads keep running after a response is sent and every instance shares JOB_QUEUE_URL; on
+# serverless hosts (Vercel) the poll can reach another instance and the job may never run
+chat_job_queue = os.getenv("CHAT_JOB_QUEUE", "0") == "1"
+
+# seconds between SSE comments sent while a streamed pitch is being graded
+SSE_KEEPALIVE_INTERVAL = 15
+
+# request gpt-4 grading as a function call with JSON arguments instead of free text
+structured_feedback = os.getenv("STRUCTURED_FEEDBACK", "0") == "1"
+
+# concurrent identical requests share one upstream OpenAI call
+evaluation_flight = SingleFlight()
+clean_flight = SingleFlight()
+
+# with SUBMISSION_WRITE_BEHIND=1, replay any submissions left in the spool by a previous process, and flush
+# the queue on shutdown
+submission_writer.start()
+atexit.register(submission_writer.close)
 
 
 def get_email():
@@ -30,6 +85,17 @@ def get_email():
     return session.get("email", "").strip().lower() if session.get("logged_in") else None
 
 
+def rate_limited(route, email):
+    '''Returns a 429 response if the caller (by email, else IP) or their domain is over the route's limit, else None.'''
+    wait = rate_limiter.check(route, email or request.remote_addr, get_domain(email) if email else None)
+    if not wait:
+        return None
+
+    retry_after = max(1, math.ceil(wait))
+    return (jsonify({"error": f"Too many requests, please try again in {retry_after}s", "retry_after": retry_after}),
+            429, {"Retry-After": str(retry_after)})
+
+
 @app.route("/")
 def root():
     return redirect(url_for("login"))
@@ -65,9 +131,273 @@ def index():
     )
 
 
+def fallback_messages(user_message):
+    '''Builds the conversation for answering a non-pitch message with the fallback prompt.'''
+    return [
+        {"role": "system", "content": prompt_store.fallback_system_prompt()},
+        {"role": "user", "content": user_message}
+    ]
+
+
+def fallback_reply(user_message):
+    '''Answers a non-pitch message conversationally with the fallback prompt.'''
+    with stage("fallback"):
+        return get_completion_from_messages(
+            messages=fallback_messages(user_message),
+            model="gpt-3.5-turbo-0125",
+            temperature=0.6,
+            max_tokens=400
+        )
+
+
+# gpt-4 only writes the Pain, Threat and Relief sections, so it needs far fewer output tokens
+EVALUATION_MODEL = "gpt-4"
+EVALUATION_MAX_TOKENS = 300
+
+PITCH_ACKNOWLEDGMENT = "Thank you for your pitch! Your submission has been received and evaluated."
+MODELS_UNAVAILABLE = "Our evaluator is temporarily unavailable. Please try submitting again in a minute."
+
+
+class ModelsUnavailable(Exception):
+    '''Raised when neither gpt-4 nor any of its fallbacks could grade a pitch.'''
+
+
+def evaluate_pitch(user_message):
+    '''Grades the judgment-heavy sections of a pitch with gpt-4. Returns (feedback, prompt version, model used).
+
+    Identical pitches graded at the same time (e.g. a double-submitted form) share one gpt-4 call.
+    Raises if gpt-4 and every fallback model failed.
+    '''
+    key = make_cache_key(user_message, fold_case=True, purpose="evaluation", version=prompt_store.version())
+    return evaluation_flight.do(key, grade_pitch, user_message)
+
+
+def grade_pitch(user_message):
+    '''Makes the gpt-4 grading call for evaluate_pitch, falling back to the next model in its chain.'''
+    prompts = prompt_store.current()
+    messages = [
+        {"role": "system", "content": prompt_store.system_prompt_for(user_message, prompts)},
+        {"role": "user", "content": user_message}
+    ]
+
+    # in structured mode the reply is a JSON object of sections, so saving it needs no text parsing
+    options = structured_request(JUDGED_SECTIONS) if structured_feedback else {}
+
+    with stage("evaluation"):
+        response, model = create_completion_with_fallback(
+            model=EVALUATION_MODEL,
+            messages=messages,
+            temperature=0.4,
+            max_tokens=EVALUATION_MAX_TOKENS,
+            **options
+        )
+
+    feedback = response_text(response)
+    if not feedback:
+        raise RuntimeError(f"{model} returned an empty evaluation")
+    return feedback, prompts["version"], model
+
+
+def classify_message(user_message):
+    '''Classifies a chat message. Returns (is_pitch, evaluation future or None).
+
+    Only inputs the local classifier can't decide need the LLM; those are graded alongside
+    classification, and the speculative grading is discarded if it turns out not to be a pitch.
+    '''
+    evaluation = None
+    with stage("classification"):
+        classification = local_classifier.classify(user_message)
+        if classification is None:
+            if speculative_evaluation:
+                evaluation = model_executor.submit(bind(evaluate_pitch), user_message)
+            classification = classify_with_llm(user_message)
+
+    is_pitch = classification.get("is_pitch", False) and classification.get("reason") != "Placeholder"
+    if not is_pitch and evaluation:
+        evaluation.cancel()
+        evaluation = None
+    return is_pitch, evaluation
+
+
+def find_duplicate(email, user_message):
+    '''Looks for an earlier copy of this pitch from the same user. Returns (reusable match, duplicate flag).
+
+    The match is only reusable for an exact copy graded by gpt-4 (not a fallback model) with the current
+    prompts; the flag is stored on the new submission for exact and near duplicates alike.
+    '''
+    with stage("dedup"):
+        match = submission_index.lookup(get_domain(email), email, user_message)
+    if match is None:
+        return None, None
+
+    duplicate = {"kind": match["kind"], "of": match["id"], "similarity": match["similarity"]}
+    if (match["kind"] == "exact" and match["prompt_version"] == prompt_store.version()
+            and match.get("model") in (None, EVALUATION_MODEL)):
+        return match, duplicate
+    return None, duplicate
+
+
+def save_reused(email, user_message, match, duplicate, doc_id=None):
+    '''Saves a resubmitted pitch with the feedback stored for its earlier copy, skipping classification and grading.'''
+    save_submission(email, user_message, match["feedback"], compute_text_metrics(user_message),
+                    match["prompt_version"], duplicate, match.get("model"), doc_id)
+
+
+def grade_and_save(email, user_message, duplicate=None, evaluation=None, doc_id=None):
+    '''Grades a pitch, or waits for the grading future already running for it, and saves the submission.
+
+    Raises ModelsUnavailable, saving nothing, if grading failed.
+    '''
+    try:
+        response, prompt_version, model = evaluation.result() if evaluation else evaluate_pitch(user_message)
+    except Exception as e:
+        raise ModelsUnavailable(f"Grading failed: {e}") from e
+
+    save_submission(email, user_message, response, compute_text_metrics(user_message), prompt_version,
+                    duplicate, model, doc_id)
+
+
+# grading futures started during classification, by the id of the job that saves the pitch
+speculative_evaluations = {}
+speculative_lock = threading.Lock()
+
+
+def hand_over_evaluation(job_id, evaluation):
+    '''Lets the grade job with this id reuse a grading future already running in this process.
+
+    The job's handler takes the entry when it runs here. If the job has left the queue by the time grading
+    finishes without taking it, another process claimed it, and only this job's entry is dropped.
+    '''
+    def drop_if_claimed(future):
+        try:
+            job = job_queue.get(job_id)
+        except Exception:
+            traceback.print_exc()
+            return
+        if job is None or job["status"] != "queued":
+            with speculative_lock:
+                speculative_evaluations.pop(job_id, None)
+
+    with speculative_lock:
+        speculative_evaluations[job_id] = evaluation
+    evaluation.add_done_callback(drop_if_claimed)
+
+
+def queue_grading(email, user_message, duplicate=None, evaluation=None, key=None):
+    '''Queues a durable job that grades and saves a pitch, handing it any grading already running. Returns the job.
+
+    The job is retried if the models are down, and resumed by the next process if this one dies.
+    '''
+    job_id = uuid.uuid4().hex
+    if evaluation:
+        hand_over_evaluation(job_id, evaluation)
+    job = job_queue.enqueue("grade", {"email": email, "message": user_message, "duplicate": duplicate},
+                            owner=email, key=f"grade:{email}:{key}" if key else None, job_id=job_id)
+    if job["id"] != job_id:
+        # the idempotency key matched an existing job, so nothing will ever run under job_id
+        with speculative_lock:
+            speculative_evaluations.pop(job_id, None)
+    return job
+
+
+def run_grade_job(job):
+    '''Job handler that grades and saves an acknowledged pitch under the job id, so a retry overwrites it.'''
+    payload = job["payload"]
+    with speculative_lock:
+        evaluation = speculative_evaluations.pop(job["id"], None)
+    grade_and_save(payload["email"], payload["message"], payload.get("duplicate"), evaluation, doc_id=job["id"])
+    return {"submission_id": job["id"]}
+
+
+def job_to_json(job):
+    '''Formats a grading job for the client. Jobs that used up their retries report MODELS_UNAVAILABLE.'''
+    data = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "status_url": url_for("chat_job_status", job_id=job["id"])
+    }
+    if job["status"] == "succeeded":
+        data.update(job["result"] or {})
+    elif job["status"] == "failed":
+        data["error"] = MODELS_UNAVAILABLE
+    return data
+
+
+def sse_event(payload):
+    '''Formats one Server-Sent Events message carrying a JSON payload.'''
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def stream_chat(email, user_message, key=None):
+    '''Yields the SSE reply for /chat: fallback answers token by token, pitches acknowledged once saved.
+
+    Without the job queue a pitch is graded and saved before its acknowledgment and the final "done" event;
+    an "error" event replaces them if grading failed. With it, the pitch is acknowledged as soon as it's queued.
+    '''
+    # an SSE comment flushes the headers right away, before classification finishes
+    yield ": accepted\n\n"
+
+    try:
+        match, duplicate = find_duplicate(email, user_message)
+        if match:
+            save_reused(email, user_message, match, duplicate)
+            yield sse_event({"delta": PITCH_ACKNOWLEDGMENT})
+            yield sse_event({"done": True})
+            return
+
+        is_pitch, evaluation = classify_message(user_message)
+
+        if not is_pitch:
+            try:
+                with stage("fallback"):
+                    for chunk in stream_completion_from_messages(fallback_messages(user_message)):
+                        yield sse_event({"delta": chunk})
+            except Exception as e:
+                # every model in the chain failed before sending anything
+                print(f"Error streaming fallback reply: {e}")
+                yield sse_event({"error": MODELS_UNAVAILABLE})
+                return
+            yield sse_event({"done": True})
+            return
+
+        if not chat_job_queue:
+            # grade and save before the stream ends: serverless hosts (Vercel) freeze anything still running
+            # once the response is sent, and the acknowledgment tells the user the pitch was evaluated
+            evaluation = evaluation or model_executor.submit(bind(evaluate_pitch), user_message)
+            while not wait([evaluation], timeout=SSE_KEEPALIVE_INTERVAL).done:
+                # keeps proxies from closing a stream that is silent while gpt-4 grades
+                yield ": grading\n\n"
+            try:
+                grade_and_save(email, user_message, duplicate, evaluation)
+            except ModelsUnavailable as e:
+                # nothing is saved without feedback; the user is asked to resubmit
+                print(f"Error evaluating pitch: {e}")
+                yield sse_event({"error": MODELS_UNAVAILABLE})
+                return
+            yield sse_event({"delta": PITCH_ACKNOWLEDGMENT})
+            yield sse_event({"done": True})
+            return
+
+        # the user only ever sees the acknowledgment; the client can poll the job to learn if grading failed
+        job = queue_grading(email, user_message, duplicate, evaluation, key)
+        yield sse_event({"delta": PITCH_ACKNOWLEDGMENT})
+        yield sse_event({"done": True, "job_id": job["id"]})
+
+    except Exception:
+        traceback.print_exc()
+        yield sse_event({"error": "Internal Server Error"})
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
-    '''Handles user submitted pitches and evaluates them using OpenAI.'''
+    '''Handles user submitted pitches and evaluates them using OpenAI.
+
+    Clients that send "stream": true (or Accept: text/event-stream) get a Server-Sent Events reply.
+    With CHAT_JOB_QUEUE=1, pitches are acknowledged right away and graded by a queued job whose id is
+    returned (202); poll /chat/jobs/<job id> to follow it. Sending an Idempotency-Key header makes
+    resubmitting the same pitch return the same job.
+    '''
     if not session.get("logged_in"):
         return jsonify({"error": "Unauthorized"}), 401
 
@@ -77,88 +407,320 @@ def chat():
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
 
+    limited = rate_limited("chat", email)
+    if limited:
+        return limited
+
+    key = request.headers.get("Idempotency-Key") or request.json.get("idempotency_key")
+
+    if request.json.get("stream") or "text/event-stream" in request.headers.get("Accept", ""):
+        return Response(stream_with_context(stream_chat(email or "N/A", user_message, key)),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     try:
-        classification = is_valid_pitch(user_message)
-
-        if not classification.get("is_pitch", False) or classification.get("reason") == "Placeholder":
-            response = get_completion_from_messages(
-                messages=[
-                    {"role": "system", "content": fallback_system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                model="gpt-3.5-turbo-0125",
-                temperature=0.6,
-                max_tokens=400
-            )
-            return jsonify({"response": response})
-
-        response = get_completion_from_messages(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            model="gpt-4",
-            temperature=0.4,
-            max_tokens=500
-        )
+        # an exact resubmission reuses the stored feedback instead of paying for another gpt-4 evaluation
+        match, duplicate = find_duplicate(email or "N/A", user_message)
+        if match:
+            save_reused(email or "N/A", user_message, match, duplicate)
+            return jsonify({"response": PITCH_ACKNOWLEDGMENT})
+
+        is_pitch, evaluation = classify_message(user_message)
+
+        if not is_pitch:
+            reply = fallback_reply(user_message)
+            if not reply:
+                return jsonify({"error": MODELS_UNAVAILABLE}), 503
+            return jsonify({"response": reply})
 
-        save_submission(email or "N/A", user_message, response)
+        if chat_job_queue:
+            data = job_to_json(queue_grading(email or "N/A", user_message, duplicate, evaluation, key))
+            return jsonify({"response": PITCH_ACKNOWLEDGMENT, **data}), 202, {"Location": data["status_url"]}
 
-        return jsonify({"response": "Thank you for your pitch! Your submission has been received and evaluated."})
+        grade_and_save(email or "N/A", user_message, duplicate, evaluation)
+        return jsonify({"response": PITCH_ACKNOWLEDGMENT})
+
+    except ModelsUnavailable as e:
+        # nothing is saved without feedback; the user is asked to resubmit
+        print(f"Error evaluating pitch: {e}")
+        return jsonify({"error": MODELS_UNAVAILABLE}), 503
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.route("/chat/jobs/<job_id>")
+def chat_job_status(job_id):
+    '''Reports a queued pitch grading's state: queued, running, succeeded or failed.
+
+    Clients poll this until the job finishes; unfinished jobs suggest when to ask again with Retry-After.
+    '''
+    if not session.get("logged_in"):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if not chat_job_queue:
+        # don't create the job database for a feature that is off
+        return jsonify({"error": "Unknown job"}), 404
+
+    email = get_email()
+    try:
+        job = job_queue.get(job_id)
+    except Exception:
+        traceback.print_exc()
+        return jsonify({"error": "Internal Server Error"}), 500
+
+    if job is None or (job["owner"] != email and email not in admin_emails):
+        return jsonify({"error": "Unknown job"}), 404
+
+    headers = {"Cache-Control": "no-store"}
+    if job["status"] not in FINISHED:
+        headers["Retry-After"] = "1"
+    return jsonify(job_to_json(job)), 200, headers
     
 
+CSV_HEADER = ["Email", "Pitch", "Pain", "Threat", "Belief Statement", "Relief", "Tone", "Length", "Clarity", "Submitted At"]
+
+
+def submission_to_row(entry):
+    '''Flattens a stored submission into a CSV row matching CSV_HEADER.'''
+    fb = entry.get("feedback", {})
+    timestamp = entry.get("submitted_at")
+    ts_str = timestamp.isoformat() if timestamp else ""
+
+    return [
+        entry.get("email", ""),
+        entry.get("pitch", ""),
+        fb.get("Pain", ""),
+        fb.get("Threat", ""),
+        fb.get("Belief Statement", ""),
+        fb.get("Relief", ""),
+        fb.get("Tone", ""),
+        fb.get("Length", ""),
+        fb.get("Clarity", ""),
+        ts_str
+    ]
+
+
+def iter_csv(rows):
+    '''Encodes rows to CSV text one row at a time, reusing a single small buffer.'''
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def generate_submissions_csv():
+    '''Yields the admin CSV export: BOM, weakness summary, then one row per submission.'''
+    yield '\ufeff'
+
+    summary_text, generated_at = refresh_weakness_summary()
+    if summary_text:
+        as_of = f" (as of {generated_at.isoformat()})" if generated_at else ""
+        summary_rows = [[f"Summary of Common Weaknesses{as_of}"]]
+        summary_rows += [[line] for line in summary_text.splitlines()]
+        summary_rows.append([])
+        yield from iter_csv(summary_rows)
+
+    with stage("csv"):
+        yield from iter_csv([CSV_HEADER])
+        yield from iter_csv(submission_to_row(entry) for entry in stream_all_submissions())
+
+
+def generate_submissions_export(fmt):
+    '''Yields the admin Parquet or Arrow export, one row group at a time.'''
+    with stage("export"):
+        yield from stream_export(stream_all_submissions(), fmt)
+
+
 @app.route("/download")
 def download_data():
-    '''Allows admin users to download all submitted pitches and evaluations as CSV.'''
+    '''Allows admin users to download all submitted pitches and evaluations as CSV.
+
+    ?format=parquet or ?format=arrow downloads the submissions as a columnar file instead, with one column
+    per feedback section plus derived numeric columns (see export.py); these need pyarrow installed.
+    '''
     email = get_email()
     if email not in admin_emails:
         return redirect(url_for("index"))
 
-    all_submissions = fetch_all_submissions()
-    summary_text = summarize_feedback(all_submissions)
+    fmt = request.args.get("format", "csv")
+    if fmt in EXPORT_FORMATS:
+        if not pyarrow_available():
+            return jsonify({"error": f"{fmt} exports need the pyarrow package installed"}), 501
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        return Response(stream_with_context(generate_submissions_export(fmt)), mimetype=mimetype,
+                        headers={"Content-Disposition": f"attachment;filename=priority_pitch_data.{extension}"})
+    if fmt != "csv":
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+
+    return Response(stream_with_context(generate_submissions_csv()), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment;filename=priority_pitch_data.csv"})
+
+
+@app.route("/summary")
+def weakness_summary():
+    '''Returns the cached weakness summary and when it was generated; pass ?refresh=1 to update it first.'''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    output = StringIO()
-    output.write('\ufeff')  
+    if request.args.get("refresh"):
+        summary_text, generated_at = refresh_weakness_summary()
+    else:
+        summary_text, generated_at = get_cached_summary()
 
-    writer = csv.writer(output)
+    return jsonify({
+        "summary": summary_text,
+        "generated_at": generated_at.isoformat() if generated_at else None
+    })
 
-    if summary_text:
-        writer.writerow(["Summary of Common Weaknesses"])
-        for line in summary_text.splitlines():
-            writer.writerow([line])
-        writer.writerow([])
-
-    # output = StringIO()
-    # output.write('\ufeff')  
-
-    # writer = csv.writer(output)
-    writer.writerow(["Email", "Pitch", "Pain", "Threat", "Belief Statement", "Relief", "Tone", "Length", "Clarity", "Submitted At"])
-
-    for entry in all_submissions:
-        fb = entry.get("feedback", {})
-        timestamp = entry.get("submitted_at")
-        ts_str = timestamp.isoformat() if timestamp else ""
-
-        writer.writerow([
-            entry.get("email", ""),
-            entry.get("pitch", ""),
-            fb.get("Pain", ""),
-            fb.get("Threat", ""),
-            fb.get("Belief Statement", ""),
-            fb.get("Relief", ""),
-            fb.get("Tone", ""),
-            fb.get("Length", ""),
-            fb.get("Clarity", ""),
-            ts_str
-        ])
-
-    output.seek(0)
-    return Response(output, mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment;filename=priority_pitch_data.csv"})
+
+CLEAN_MODEL_PARAMS = {"model": "gpt-3.5-turbo-0125", "temperature": 0, "max_tokens": 200}
+
+
+@app.route("/admin/analytics")
+def analytics():
+    '''Returns per-domain submission trends from the precomputed aggregates (pass ?days=N to limit daily counts).'''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    days = request.args.get("days", type=int)
+    domains = sorted((summarize_aggregate(a, days) for a in load_aggregates()), key=lambda d: -d["total"])
+
+    return jsonify({"domains": domains, "total": sum(d["total"] for d in domains)})
+
+
+# largest ?limit= the submissions API accepts
+SUBMISSIONS_PAGE_LIMIT = 200
+
+
+def parse_timestamp(value):
+    '''Parses an ISO date or datetime from a query string; values without an offset are taken as UTC.'''
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def encode_cursor(cursor):
+    '''Turns a (submitted_at, domain, id) page cursor into an opaque URL-safe string.'''
+    if cursor is None:
+        return None
+    at, domain, doc_id = cursor
+    return base64.urlsafe_b64encode(json.dumps([at.isoformat(), domain, doc_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(value):
+    at, domain, doc_id = json.loads(base64.urlsafe_b64decode(value.encode("ascii")))
+    return parse_timestamp(at), domain, doc_id
+
+
+def parse_submission_filters(args):
+    '''Reads the submissions API query string. Raises ValueError describing the first invalid parameter.'''
+    email = args.get("email", "").strip().lower() or None
+    domain = get_domain(args["domain"].strip()) if args.get("domain", "").strip() else None
+    if email and domain and get_domain(email) != domain:
+        raise ValueError("email is not in the requested domain")
+    domain = domain or (get_domain(email) if email else None)
+    if domain and domain.startswith(INTERNAL_PREFIX):
+        raise ValueError("Invalid domain")
+
+    order = args.get("order", "desc")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    try:
+        since = parse_timestamp(args["since"]) if args.get("since") else None
+        until = parse_timestamp(args["until"]) if args.get("until") else None
+    except ValueError:
+        raise ValueError("since and until must be ISO dates or datetimes")
+
+    limit = args.get("limit", 50, type=int)
+    if limit is None or not 1 <= limit <= SUBMISSIONS_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {SUBMISSIONS_PAGE_LIMIT}")
+
+    try:
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    return {"domain": domain, "email": email, "since": since, "until": until,
+            "descending": order == "desc", "limit": limit, "cursor": cursor}
+
+
+def submissions_etag(domains, args):
+    '''ETag for a submissions page, built from the query string and the per-domain aggregate counters.
+
+    Every saved submission bumps its domain's aggregate in the same batch, so the tag changes exactly when
+    a page could have; checking it costs one small read per domain instead of rerunning the page query.
+    '''
+    aggregates = [load_aggregate(domains[0])] if len(domains) == 1 else load_aggregates()
+    state = sorted((a.get("domain"), a.get("total"), str(a.get("updated_at"))) for a in aggregates if a)
+    payload = json.dumps([sorted(args.items(multi=True)), state], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def submission_to_json(entry):
+    '''Formats a stored submission for the JSON API.'''
+    submitted_at = entry.get("submitted_at")
+    return {**entry, "submitted_at": submitted_at.isoformat() if hasattr(submitted_at, "isoformat") else None}
+
+
+@app.route("/admin/submissions")
+def list_submissions():
+    '''Returns one page of submissions as JSON, newest first (?order=asc for oldest first).
+
+    Filter with ?domain=, ?email=, ?since= and ?until= (ISO dates or datetimes, UTC unless an offset is
+    given) and size pages with ?limit=. Pass the returned next_cursor as ?cursor= to get the next page.
+    Responses carry an ETag; a request with a matching If-None-Match gets a 304 without the page query.
+    '''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        filters = parse_submission_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        domain = filters.pop("domain")
+        domains = [domain] if domain else [col.id for col in submission_collections()]
+        etag = submissions_etag(domains, request.args)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            entries, cursor = fetch_submissions_page(domains, **filters)
+            response = jsonify({
+                "submissions": [submission_to_json(entry) for entry in entries],
+                "next_cursor": encode_cursor(cursor)
+            })
+    except Exception:
+        traceback.print_exc()
+        return jsonify({"error": "Internal Server Error"}), 500
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def punctuate(raw_text):
+    '''Asks OpenAI to add punctuation and capitalization to a voice transcript without changing its words.'''
+    prompt = (
+        "You are a helpful assistant. Add proper punctuation and capitalization to the following text. "
+        "Do not change any words, just fix punctuation and capitalization. Return only the improved text.\n\n"
+        f"Text: {raw_text}"
+    )
+
+    messages = [
+        {"role": "system", "content": prompt}
+    ]
+
+    return get_completion_from_messages(messages, **CLEAN_MODEL_PARAMS)
 
 
 @app.route("/clean", methods=["POST"])
@@ -169,29 +731,141 @@ def clean_pitch():
     if not raw_text:
         return jsonify({"error": "No text provided"}), 400
     try:
-        prompt = (
-            "You are a helpful assistant. Add proper punctuation and capitalization to the following text. "
-            "Do not change any words, just fix punctuation and capitalization. Return only the improved text.\n\n"
-            f"Text: {raw_text}"
-        )
-
-        messages = [
-            {"role": "system", "content": prompt}
-        ]
-
-        result = get_completion_from_messages(
-            messages, 
-            model="gpt-3.5-turbo-0125", 
-            temperature=0, 
-            max_tokens=200)
+        # temperature 0 makes the output a pure function of the input, so identical transcripts are cached;
+        # the key keeps case, since fixing capitalization is what /clean is for
+        cache_key = make_cache_key(raw_text, **CLEAN_MODEL_PARAMS)
+        cached = clean_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({"punctuated": cached})
+
+        # only cache misses cost model quota, so only they count against the limit
+        limited = rate_limited("clean", get_email())
+        if limited:
+            return limited
+
+        result = clean_flight.do(cache_key, punctuate, raw_text)
         
         if not result:
             return jsonify({"error": "Faclean_pitch text"}), 500
+
+        clean_cache.set(cache_key, result.strip())
         return jsonify({"punctuated": result.strip()})
     
     except Exception as e:
         print("ERROR in /punctuate route:", e)
         return jsonify({"error": "Internal Server Error"}), 500
 
+
+@app.route("/admin/bulk", methods=["POST"])
+def bulk_evaluate():
+    '''Evaluates an uploaded CSV/JSONL file of pitches (form field "file"), streaming progress as Server-Sent Events.
+
+    Rows without an email are saved under the form's "email" (default: the admin's). Pass mode=batch
+    to submit an OpenAI Batch API job instead, then collect it from /admin/bulk/<batch id>.
+    '''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "No file provided"}), 400
+
+    try:
+        items = parse_pitches(upload.read().decode("utf-8"), upload.filename or "", request.form.get("email") or email)
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.form.get("mode") == "batch":
+        try:
+            batch_id = submit_openai_batch(items, EVALUATION_MAX_TOKENS)
+        except Exception:
+            traceback.print_exc()
+            return jsonify({"error": "Internal Server Error"}), 500
+        return jsonify({"batch_id": batch_id, "total": len(items)}), 202
+
+    concurrency = min(request.form.get("concurrency", BULK_CONCURRENCY, type=int), BULK_CONCURRENCY)
+    events = (sse_event(event) for event in run_bulk(items, evaluate_pitch, concurrency))
+    return Response(stream_with_context(events), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/admin/bulk/<batch_id>")
+def bulk_batch_status(batch_id):
+    '''Checks an OpenAI Batch API bulk job and saves its results once it has completed.'''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        return jsonify(collect_openai_batch(batch_id))
+    except KeyError:
+        return jsonify({"error": "Unknown batch"}), 404
+    except Exception:
+        traceback.print_exc()
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    '''Returns cache, classifier, writer, parser, dedup, rate limit, coalescing and job queue counters to admin users.'''
+    email = get_email()
+    if email not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify({
+        "clean": clean_cache.stats(),
+        "classifier": local_classifier.stats(),
+        "writer": submission_writer.stats(),
+        "feedback_parser": parse_stats,
+        "dedup": submission_index.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "evaluation_coalescing": evaluation_flight.stats(),
+        "clean_coalescing": clean_flight.stats(),
+        "jobs": job_queue.stats()
+    })
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    '''Prometheus scrape endpoint: stage timings, OpenAI latency and token counters, and component stats.
+
+    Open to admin sessions, or to scrapers sending "Authorization: Bearer $METRICS_TOKEN".
+    '''
+    token = os.getenv("METRICS_TOKEN")
+    authorized = token and request.headers.get("Authorization") == f"Bearer {token}"
+    if not authorized and get_email() not in admin_emails:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics.register_stats("clean_cache", clean_cache.stats)
+metrics.register_stats("classifier", local_classifier.stats)
+metrics.register_stats("writer", submission_writer.stats)
+metrics.register_stats("feedback_parser", lambda: parse_stats)
+metrics.register_stats("dedup", submission_index.stats)
+metrics.register_stats("scheduler", scheduler.stats)
+metrics.register_stats("rate_limiter", rate_limiter.stats)
+metrics.register_stats("evaluation_coalescing", evaluation_flight.stats)
+metrics.register_stats("clean_coalescing", clean_flight.stats)
+metrics.register_stats("jobs", job_queue.stats)
+
+job_queue.register("grade", run_grade_job)
+# workers stop before the writer's final flush
+atexit.register(job_queue.close)
+
+
+def start_job_workers():
+    '''Starts the job workers in a web process, resuming jobs a previous process left queued or running.
+
+    Called from the web entry points rather than on import, so scripts that import the app (bulk.py, the
+    benchmarks) never claim web users' jobs. The first enqueue also starts them.
+    '''
+    if chat_job_queue:
+        job_queue.start()
+
+
 if __name__ == "__main__":
+    start_job_workers()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,345 @@
+import os
+import re
+import json
+import time
+import fcntl
+import uuid
+import queue
+import tempfile
+import threading
+import traceback
+from metrics import stage
+
+# Firestore rejects batched writes with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+# placeholder stored in spooled entries and swapped for firestore.SERVER_TIMESTAMP at commit time
+SERVER_TIMESTAMP = "__server_timestamp__"
+
+# queue writes and commit them in batches from a background thread (SUBMISSION_WRITE_BEHIND=1). Only enable
+# it where threads keep running after a response is sent and the temp dir outlives the instance; on serverless
+# hosts (Vercel) queued writes wait for the instance's next request and are lost if it is recycled
+WRITE_BEHIND = os.getenv("SUBMISSION_WRITE_BEHIND", "0") == "1"
+# each process spools to this path with its pid inserted, e.g. submission_spool.<pid>.jsonl
+SPOOL_PATH = os.getenv("SUBMISSION_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "submission_spool.jsonl"))
+FLUSH_INTERVAL = float(os.getenv("SUBMISSION_FLUSH_INTERVAL", "1.0"))
+# at most half the limit per batch, leaving room for writes added by batch hooks
+BATCH_SIZE = min(int(os.getenv("SUBMISSION_BATCH_SIZE", "200")), MAX_BATCH_SIZE // 2)
+MAX_QUEUE = int(os.getenv("SUBMISSION_MAX_QUEUE", "5000"))
+ENQUEUE_TIMEOUT = float(os.getenv("SUBMISSION_ENQUEUE_TIMEOUT", "2.0"))
+SPOOL_FSYNC = os.getenv("SUBMISSION_SPOOL_FSYNC", "0") == "1"
+SPOOL_COMPACT_BYTES = 1024 * 1024
+
+
+class Spool:
+    '''Append-only JSONL log of queued writes; a record stays pending until a "done" line names its id.
+
+    Each process writes its own file (the configured path with its pid inserted) and holds an exclusive
+    flock on it while alive. A spool file nobody holds belongs to a process that died, so its pending
+    records can be adopted without replaying writes a live process still owns.
+    '''
+
+    def __init__(self, base_path, fsync=SPOOL_FSYNC):
+        self.base_path = base_path
+        self.path = None
+        self.fsync = fsync
+        self.holder = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        '''Creates this process's spool file and locks it for the life of the process.'''
+        root, ext = os.path.splitext(self.base_path)
+        self.path = f"{root}.{os.getpid()}{ext}"
+        self.holder = open(self.path, "a", encoding="utf-8")
+        fcntl.flock(self.holder, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _append(self, lines):
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line) + "\n" for line in lines))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def add(self, record):
+        self._append([{"record": record}])
+
+    def mark_done(self, ids):
+        self._append([{"done": list(ids)}])
+
+    def pending(self):
+        '''Returns records that were spooled but never confirmed written.'''
+        with self.lock:
+            return read_pending(self.path)
+
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def compact(self):
+        '''Rewrites the spool with only the still-pending records and returns them.'''
+        tmp_path = self.path + ".tmp"
+        with self.lock:
+            pending = read_pending(self.path)
+            holder = open(tmp_path, "w", encoding="utf-8")
+            holder.write("".join(json.dumps({"record": r}) + "\n" for r in pending))
+            holder.flush()
+            # lock the new file before it takes the old one's place, so it never looks abandoned
+            fcntl.flock(holder, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.replace(tmp_path, self.path)
+            self.holder.close()
+            self.holder = holder
+        return pending
+
+    def close(self):
+        '''Compacts the spool on shutdown, deleting the file if nothing is left pending.'''
+        if not self.compact():
+            with self.lock:
+                os.remove(self.path)
+                self.holder.close()
+                self.holder = None
+
+    def orphans(self):
+        '''Paths of other processes' spool files (and the pre-pid shared one), which may be abandoned.'''
+        root, ext = os.path.splitext(self.base_path)
+        pattern = re.compile(re.escape(os.path.basename(root)) + r"\.\d+" + re.escape(ext) + "$")
+        directory = os.path.dirname(self.base_path) or "."
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if pattern.match(name)]
+        return [p for p in paths + [self.base_path] if p != self.path and os.path.exists(p)]
+
+    def adopt_orphans(self):
+        '''Moves the pending records of spool files whose process died into this one and returns them.'''
+        adopted = []
+        for path in self.orphans():
+            try:
+                f = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # its process is alive
+                    continue
+                try:
+                    if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                        # another process adopted it and a new file took its name
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                records = read_pending(path)
+                if records:
+                    self._append([{"record": r} for r in records])
+                os.remove(path)
+                adopted.extend(records)
+        return adopted
+
+
+def read_pending(path):
+    '''Returns the records in a spool file that were never marked done.'''
+    records, done = {}, set()
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # a torn final line from a crash mid-write
+                continue
+            if "record" in item:
+                records[item["record"]["id"]] = item["record"]
+            else:
+                done.update(item.get("done", []))
+
+    return [r for rid, r in records.items() if rid not in done]
+
+
+class BatchedWriter:
+    '''Write-behind queue that groups Firestore writes into batched commits, flushed on size or time.
+
+    Every record is appended to a local spool before it is queued, so writes that were accepted but
+    not yet committed are replayed after a crash. Writes use generated document ids, so replaying a
+    record that did commit just overwrites it with the same data.
+
+    With write_behind off, enqueue() commits each write itself (batch hooks included) before returning
+    and raises if the commit fails; there is no thread or spool.
+    '''
+
+    def __init__(self, client_factory=None, spool_path=SPOOL_PATH, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE, enqueue_timeout=ENQUEUE_TIMEOUT,
+                 write_behind=WRITE_BEHIND):
+        self.client_factory = client_factory
+        self.write_behind = write_behind
+        self.spool = Spool(spool_path) if spool_path else None
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE // 2)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.commit_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.stopping = False
+        self.batch_hooks = []
+        self.metrics = {
+            "enqueued": 0, "written": 0, "batches": 0, "failed_batches": 0,
+            "replayed": 0, "backpressure_waits": 0, "inline_writes": 0, "last_flush_ms": 0.0,
+        }
+
+    def add_batch_hook(self, hook):
+        '''Registers hook(client, batch, records), called before each commit to add related writes.
+
+        Hooks only see the records whose documents don't exist yet, so a replayed or retried write
+        (same document id) never adds its related writes twice.
+        '''
+        self.batch_hooks.append(hook)
+
+    def client(self):
+        if self.client_factory is None:
+            from firestore import get_db
+            self.client_factory = get_db
+        return self.client_factory()
+
+    def start(self):
+        '''Replays any pending spooled writes and starts the background flusher thread, if writing behind.'''
+        with self.start_lock:
+            if self.thread is not None or not self.write_behind:
+                return
+            self.stopping = False
+
+            if self.spool:
+                if self.spool.holder is None:
+                    self.spool.open()
+                pending = self.spool.compact() + self.spool.adopt_orphans()
+                for record in pending:
+                    self.queue.put(record)
+                self.metrics["replayed"] += len(pending)
+
+            self.thread = threading.Thread(target=self.run, name="batched-writer", daemon=True)
+            self.thread.start()
+
+    def enqueue(self, collection, data, doc_id=None):
+        '''Queues a document write. data must be JSON-serializable (use SERVER_TIMESTAMP for server times).'''
+        record = {"id": doc_id or uuid.uuid4().hex, "collection": collection, "data": data}
+        if not self.write_behind:
+            self.metrics["enqueued"] += 1
+            self.commit([record])
+            return record["id"]
+
+        self.start()
+        if self.spool:
+            self.spool.add(record)
+        self.metrics["enqueued"] += 1
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # backpressure: wait for the flusher to catch up, then write inline rather than drop
+            self.metrics["backpressure_waits"] += 1
+            try:
+                self.queue.put(record, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self.metrics["inline_writes"] += 1
+                self.commit([record])
+        return record["id"]
+
+    def run(self):
+        while not self.stopping:
+            records = self.drain(block=True)
+            if records:
+                self.commit_with_retry(records)
+            if self.spool and self.queue.empty() and self.spool.size() > SPOOL_COMPACT_BYTES:
+                self.spool.compact()
+
+    def drain(self, block=False):
+        '''Collects up to one batch of queued records, waiting up to flush_interval for the first.'''
+        records = []
+        try:
+            records.append(self.queue.get(timeout=self.flush_interval) if block else self.queue.get_nowait())
+        except queue.Empty:
+            return records
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(records) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not block:
+                remaining = 0
+            try:
+                records.append(self.queue.get(timeout=remaining) if remaining else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def commit(self, records):
+        '''Writes records in one Firestore batch and marks them done in the spool.
+
+        New documents are written with create(), which fails the batch if the document appeared since
+        the existence check; the retry then sees it and leaves its related writes out.
+        '''
+        from firestore import firestore_api
+
+        started = time.perf_counter()
+        with self.commit_lock, stage("firestore_write"):
+            client = self.client()
+            batch = client.batch()
+            refs = [client.collection(r["collection"]).document(r["id"]) for r in records]
+            existing = {snapshot.reference.path for snapshot in client.get_all(refs) if snapshot.exists}
+
+            created = []
+            for record, ref in zip(records, refs):
+                data = {k: (firestore_api().SERVER_TIMESTAMP if v == SERVER_TIMESTAMP else v)
+                        for k, v in record["data"].items()}
+                if ref.path in existing:
+                    batch.set(ref, data)
+                else:
+                    batch.create(ref, data)
+                    created.append(record)
+                    # a later copy in this batch (e.g. a retried job) only rewrites it
+                    existing.add(ref.path)
+            for hook in self.batch_hooks:
+                hook(client, batch, created)
+            batch.commit()
+
+        if self.spool and self.write_behind:
+            self.spool.mark_done(r["id"] for r in records)
+        self.metrics["written"] += len(records)
+        self.metrics["batches"] += 1
+        self.metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def commit_with_retry(self, records, attempts=5):
+        for attempt in range(attempts):
+            try:
+                self.commit(records)
+                return True
+            except Exception:
+                self.metrics["failed_batches"] += 1
+                traceback.print_exc()
+                time.sleep(min(2 ** attempt, 30))
+        # leave them in the spool; they are replayed on the next start
+        print(f"Giving up on {len(records)} queued writes for now; they remain in the spool")
+        return False
+
+    def flush(self):
+        '''Synchronously writes everything currently queued (used on shutdown and in tests).'''
+        while True:
+            records = self.drain(block=False)
+            if not records:
+                return
+            self.commit_with_retry(records)
+
+    def close(self):
+        '''Stops the flusher thread after writing what is queued, then compacts the spool.'''
+        self.stopping = True
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 1)
+            self.thread = None
+        self.flush()
+        if self.spool and self.spool.holder is not None:
+            self.spool.close()
+
+    def stats(self):
+        '''Returns queue depth and write counters for monitoring.'''
+        return {**self.metrics, "queued": self.queue.qsize(), "max_queue": self.queue.maxsize}
+
+
+submission_writer = BatchedWriter()
@@ -0,0 +1,384 @@
+'''
+Local stand-ins for OpenAI and Firestore used by the load-test harness (see load_test.py).
+
+Usage: python benchmarks/fakes.py [--port 8765] [--latency gpt-4=lognormal:2.0:0.4] [--error-rate 0.05]
+
+FakeOpenAIHandler answers /v1/chat/completions (including streaming and function calling) after a
+delay drawn from a per-model latency distribution, and returns 429s with Retry-After at a given rate.
+InMemoryFirestore implements the slice of the Firestore client the app uses, so it can be swapped in
+with services.override("firestore", InMemoryFirestore()).
+'''
+import copy
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+EVALUATION_REPLY = (
+    "**Pain:** The pitch names a concrete cost the buyer already feels, but never quantifies it.\n\n"
+    "**Threat:** N/A - the pitch should describe what happens if nothing changes.\n\n"
+    "**Relief:** The outcome is clear, though it reads like a feature list."
+)
+FALLBACK_REPLY = "Happy to help! Paste your elevator pitch whenever you're ready and I'll evaluate it."
+
+
+def parse_latency(spec):
+    '''Turns "fixed:S", "uniform:LOW:HIGH" or "lognormal:MEDIAN:SIGMA" (seconds) into a sampler.'''
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def parse_latencies(specs):
+    '''Parses repeated "model=spec" options; a spec without a model sets the default ("*").'''
+    latencies = {"*": parse_latency("lognormal:0.4:0.3")}
+    for spec in specs or []:
+        model, _, dist = spec.rpartition("=")
+        latencies[model or "*"] = parse_latency(dist)
+    return latencies
+
+
+def reply_for(body):
+    '''Picks a plausible completion for the request: a classification, an evaluation or a fallback answer.'''
+    system = next((m["content"] for m in body.get("messages", []) if m["role"] == "system"), "")
+    if system.startswith("You are a classifier"):
+        return json.dumps({"is_pitch": True, "reason": "PitchLike"})
+    if body.get("model") == "gpt-4":
+        return EVALUATION_REPLY
+    if "punctuation" in system:
+        return system.rsplit("Text:", 1)[-1].strip().capitalize() + "."
+    return FALLBACK_REPLY
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    '''Chat completions endpoint; configure through the class attributes (see serve_openai).'''
+
+    protocol_version = "HTTP/1.1"
+    latencies = parse_latencies(None)
+    error_rate = 0.0
+    token_interval = 0.02
+    counter = itertools.count()
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, payload):
+        data = f"data: {payload}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        next(self.counter)
+        model = body.get("model", "")
+
+        with self.rng_lock:
+            throttled = self.rng.random() < self.error_rate
+            delay = (self.latencies.get(model) or self.latencies["*"])(self.rng)
+
+        if throttled:
+            return self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                  {"retry-after": "0.2"})
+
+        text = reply_for(body)
+        usage = {"prompt_tokens": sum(len(m["content"]) // 4 for m in body["messages"]),
+                 "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            # the first token arrives after the sampled latency, the rest at token_interval
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(text.split(" ")):
+                if i:
+                    time.sleep(self.token_interval)
+                delta = {"content": word if i == 0 else " " + word}
+                self.send_chunk(json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }))
+            self.send_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(delay)
+        message = {"role": "assistant", "content": text}
+        if body.get("tools"):
+            name = body["tools"][0]["function"]["name"]
+            sections = body["tools"][0]["function"]["parameters"]["required"]
+            arguments = json.dumps({section: f"{section} feedback." for section in sections})
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": "call_fake", "type": "function", "function": {"name": name, "arguments": arguments}},
+            ]}
+
+        self.send_json(200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            "usage": usage,
+        })
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 refuses connections when the app opens its pool all at once
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        # clients hang up on purpose (timeouts, cancelled hedges); a broken pipe here isn't worth a traceback
+        pass
+
+
+def serve_openai(port=8765, latencies=None, error_rate=0.0, token_interval=0.02, seed=0):
+    '''Starts the fake OpenAI server on a background thread and returns it.'''
+    FakeOpenAIHandler.latencies = latencies or parse_latencies(None)
+    FakeOpenAIHandler.error_rate = error_rate
+    FakeOpenAIHandler.token_interval = token_interval
+    FakeOpenAIHandler.rng = random.Random(seed)
+
+    server = FakeOpenAIServer(("127.0.0.1", port), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def resolve(value, existing=None):
+    '''Applies Firestore write transforms (SERVER_TIMESTAMP, Increment) the way the server would.'''
+    from firebase_admin import firestore
+
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, firestore.Increment):
+        return (existing if isinstance(existing, (int, float)) else 0) + value.value
+    if isinstance(value, dict):
+        base = existing if isinstance(existing, dict) else {}
+        return {k: resolve(v, base.get(k)) for k, v in value.items()}
+    return value
+
+
+def merge_fields(existing, update):
+    '''set(..., merge=True): nested maps are merged key by key, everything else replaced.'''
+    merged = dict(existing)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_fields(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self.collection.id}/{self.id}"
+
+    def get(self):
+        with self.collection.db.lock:
+            return FakeSnapshot(self, self.collection.docs.get(self.id))
+
+    def set(self, data, merge=False):
+        with self.collection.db.lock:
+            existing = self.collection.docs.get(self.id) or {}
+            resolved = resolve(data, existing if merge else None)
+            self.collection.docs[self.id] = merge_fields(existing, resolved) if merge else resolved
+
+
+class FakeQuery:
+    OPERATORS = {
+        "==": lambda a, b: a == b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+    }
+
+    def __init__(self, collection, filters=(), order=None, descending=False, limit_to=None, after=None,
+                 inclusive=False):
+        self.collection = collection
+        self.filters = filters
+        self.order = order
+        self.descending = descending
+        self.limit_to = limit_to
+        self.after = after
+        self.inclusive = inclusive
+
+    def _copy(self, **changes):
+        state = {"filters": self.filters, "order": self.order, "descending": self.descending,
+                 "limit_to": self.limit_to, "after": self.after, "inclusive": self.inclusive}
+        state.update(changes)
+        return FakeQuery(self.collection, **state)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        if field == "__name__" and self.order not in (None, "__name__"):
+            # the document id already breaks ties in sort_key
+            return self
+        return self._copy(order=field, descending=direction == "DESCENDING")
+
+    def limit(self, count):
+        return self._copy(limit_to=count)
+
+    def start_after(self, cursor):
+        return self._copy(after=cursor, inclusive=False)
+
+    def start_at(self, cursor):
+        return self._copy(after=cursor, inclusive=True)
+
+    def cursor_key(self):
+        '''sort_key of the cursor (a snapshot or a {field: value} dict), cut short for a partial dict.'''
+        if not isinstance(self.after, dict):
+            return self.sort_key(self.after.id, self.after._data)
+        if self.order in (None, "__name__"):
+            return (True, self.after["__name__"], self.after["__name__"])
+        key = (self.after.get(self.order) is not None, self.after.get(self.order))
+        return key + (self.after["__name__"],) if "__name__" in self.after else key
+
+    def sort_key(self, doc_id, data):
+        if self.order and self.order != "__name__":
+            return (data.get(self.order) is not None, data.get(self.order), doc_id)
+        return (True, doc_id, doc_id)
+
+    def stream(self):
+        with self.collection.db.lock:
+            items = list(self.collection.docs.items())
+
+        for field, op, value in self.filters:
+            items = [(k, d) for k, d in items if self.OPERATORS[op](d.get(field), value)]
+        items.sort(key=lambda item: self.sort_key(*item), reverse=self.descending)
+
+        if self.after is not None:
+            cursor = self.cursor_key()
+            keep = {
+                (False, False): lambda key: key > cursor,
+                (False, True): lambda key: key >= cursor,
+                (True, False): lambda key: key < cursor,
+                (True, True): lambda key: key <= cursor,
+            }[(self.descending, self.inclusive)]
+            items = [item for item in items if keep(self.sort_key(*item)[:len(cursor)])]
+        if self.limit_to:
+            items = items[:self.limit_to]
+
+        return [FakeSnapshot(FakeDocumentRef(self.collection, k), d) for k, d in items]
+
+    get = stream
+
+
+class FakeCollection(FakeQuery):
+    ids = itertools.count()
+
+    def __init__(self, db, name):
+        super().__init__(self)
+        self.db = db
+        self.id = name
+        self.docs = {}
+
+    def document(self, doc_id=None):
+        return FakeDocumentRef(self, doc_id or f"{next(self.ids):020d}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+        self.creates = []
+
+    def set(self, reference, data, merge=False):
+        self.writes.append((reference, data, merge))
+
+    def create(self, reference, data):
+        self.creates.append(reference)
+        self.writes.append((reference, data, False))
+
+    def commit(self):
+        # all or nothing, like a real batch: a create() of an existing document fails every write
+        with self.db.lock:
+            for reference in self.creates:
+                if reference.id in reference.collection.docs:
+                    raise ValueError(f"Document already exists: {reference.path}")
+            for reference, data, merge in self.writes:
+                reference.set(data, merge=merge)
+
+
+class InMemoryFirestore:
+    '''The subset of google.cloud.firestore.Client used by firestore.py, summary.py and aggregates.py.'''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.collections_by_name = {}
+
+    def collection(self, name):
+        with self.lock:
+            if name not in self.collections_by_name:
+                self.collections_by_name[name] = FakeCollection(self, name)
+            return self.collections_by_name[name]
+
+    def collections(self):
+        with self.lock:
+            return list(self.collections_by_name.values())
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, references):
+        return [reference.get() for reference in references]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", help="[model=]fixed:S | uniform:LOW:HIGH | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve_openai(args.port, parse_latencies(args.latency), args.error_rate, args.token_interval, args.seed)
+    print(f"Fake OpenAI listening on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
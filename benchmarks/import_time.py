@@ -0,0 +1,78 @@
+'''
+Profiles how long `import app` takes using `python -X importtime` and fails if it regresses.
+
+Usage: python benchmarks/import_time.py [--budget-ms 400] [--top 15]
+
+Exits non-zero if the app import exceeds the budget or eagerly imports a heavy SDK that the
+service registry is supposed to defer (see services.py).
+'''
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must only load when a route first needs them
+DEFERRED_MODULES = ["firebase_admin", "google.cloud.firestore", "grpc", "openai", "httpx", "yaml"]
+
+LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile_import(module="app", runs=3):
+    '''Imports module in fresh interpreters and returns the per-module timings of the fastest run.'''
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"))
+    best = None
+
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+        timings = {}
+        for line in result.stderr.splitlines():
+            match = LINE_RE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                timings[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+
+        if best is None or timings[module][1] < best[module][1]:
+            best = timings
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "400")))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    timings = profile_import(args.module, args.runs)
+    total_ms = timings[args.module][1] / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, (self_us, cumulative_us, depth) in sorted(timings.items(), key=lambda t: -t[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    print(f"\nimport {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    eager = [m for m in DEFERRED_MODULES if m in timings]
+    if eager:
+        failures.append(f"heavy modules imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
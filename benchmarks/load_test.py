@@ -0,0 +1,356 @@
+'''
+Offline load test: runs the real Flask app against local OpenAI and Firestore stand-ins.
+
+Usage: python benchmarks/load_test.py [--endpoints chat,clean,download] [--requests 200] [--concurrency 16]
+                                      [--latency gpt-4=lognormal:2.0:0.4] [--error-rate 0.05] [--stream]
+                                      [--json results.json]
+
+The fake OpenAI server (fakes.py) runs in a subprocess so it doesn't compete with the app for the GIL.
+The app is served by werkzeug's threaded server in this process, with services.override() pointing
+Firestore at an in-memory fake. Each endpoint is driven in turn at the given concurrency and reported
+with throughput, p50/p95/p99 latency (full response and first byte), errors, and process memory.
+With CHAT_JOB_QUEUE=1, queued pitches are polled until their grading job finishes, so their latency is the
+time until the pitch was saved and their first byte is the 202 that queued it.
+Save --json output from two runs to compare a change to model.py or firestore.py.
+'''
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import http.client
+import urllib.parse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+ADMIN_EMAIL = "admin@bench.local"
+DOMAINS = ["acme.com", "globex.com", "initech.com", "umbrella.com"]
+
+PROBLEMS = [
+    "sales reps waste {n} hours a week updating the CRM by hand",
+    "finance teams spend {n} days every month reconciling invoices in spreadsheets",
+    "clinics lose {n} appointments a week to last-minute cancellations",
+    "support agents answer the same {n} questions every shift",
+]
+THREATS = [
+    "If nothing changes, quota attainment keeps slipping and top performers leave.",
+    "Every delayed close pushes reporting back and erodes trust with the board.",
+    "Empty chairs cost thousands in revenue that never comes back.",
+    "Response times climb and customers quietly churn to competitors.",
+]
+RELIEFS = [
+    "We automate the busywork so people get back to the work that matters.",
+    "Our platform handles it end to end in minutes instead of days.",
+    "We fill the gap automatically and report the recovered revenue weekly.",
+]
+NON_PITCHES = ["Hi there!", "What can you do?", "How should I structure my pitch?", "thanks"]
+DICTATIONS = [
+    "so basically our customers keep telling us onboarding takes way too long",
+    "i think the biggest issue is that nobody owns the renewal process",
+    "we help small clinics fill cancelled appointments automatically",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    sys.exit(f"Nothing listening on port {port}")
+
+
+def rss_mb():
+    '''Current resident set size of this process in MB (Linux), or None elsewhere.'''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values, pct):
+    '''Nearest-rank percentile of an already sorted list.'''
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def make_pitch(rng):
+    return " ".join([
+        f"Our {rng.choice(PROBLEMS).format(n=rng.randint(2, 40))}.",
+        rng.choice(THREATS),
+        rng.choice(RELIEFS),
+    ])
+
+
+class Client:
+    '''One logged-in user session over a keep-alive connection to the app.'''
+
+    def __init__(self, port, email):
+        self.port = port
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        self.cookie = ""
+        self.last_body = {}
+        status, headers, _, _ = self.request("POST", "/login", urllib.parse.urlencode({"email": email}),
+                                             {"Content-Type": "application/x-www-form-urlencoded"})
+        self.cookie = headers.get("Set-Cookie", "").split(";", 1)[0]
+
+    def request(self, method, path, body=None, headers=None):
+        '''Returns (status, headers, seconds to first byte, seconds to last byte).'''
+        headers = dict(headers or {}, Cookie=self.cookie)
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # the server closed the keep-alive connection; retry once on a fresh one
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+
+        first_byte = None
+        chunks = []
+        while True:
+            chunk = response.read1(65536) if hasattr(response, "read1") else response.read(65536)
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            if not chunk:
+                break
+            if response.getheader("Content-Type", "").startswith("application/json"):
+                chunks.append(chunk)
+        self.last_body = json.loads(b"".join(chunks)) if chunks else {}
+        return response.status, dict(response.getheaders()), first_byte, time.perf_counter() - started
+
+
+def chat_request(client, rng, args):
+    if rng.random() < args.pitch_ratio:
+        message = make_pitch(rng)
+    else:
+        message = rng.choice(NON_PITCHES)
+    headers = {"Content-Type": "application/json"}
+    if args.stream:
+        headers["Accept"] = "text/event-stream"
+    status, response_headers, first_byte, total = client.request(
+        "POST", "/chat", json.dumps({"message": message, "stream": args.stream}), headers)
+    if status != 202:
+        return status, response_headers, first_byte, total
+
+    # a queued pitch: poll its grading job and report the time until it was saved
+    started = time.perf_counter() - total
+    location = response_headers.get("Location")
+    while True:
+        time.sleep(0.1)
+        status, response_headers, _, _ = client.request("GET", location)
+        if status != 200 or client.last_body.get("status") in ("succeeded", "failed"):
+            break
+    if client.last_body.get("status") == "failed":
+        status = "job failed"
+    return status, response_headers, first_byte, time.perf_counter() - started
+
+
+def clean_request(client, rng, args):
+    text = rng.choice(DICTATIONS)
+    if rng.random() >= args.clean_repeat_ratio:
+        text += f" and we have {rng.randint(1, 10 ** 6)} customers"
+    return client.request("POST", "/clean", json.dumps({"text": text}), {"Content-Type": "application/json"})
+
+
+def download_request(client, rng, args):
+    return client.request("GET", "/download")
+
+
+ENDPOINTS = {"chat": chat_request, "clean": clean_request, "download": download_request}
+
+
+def run_endpoint(name, port, args):
+    '''Sends args.requests requests to one endpoint from args.concurrency sessions and summarizes them.'''
+    request_fn = ENDPOINTS[name]
+    per_worker = [args.requests // args.concurrency + (1 if i < args.requests % args.concurrency else 0)
+                  for i in range(args.concurrency)]
+    results, lock = [], threading.Lock()
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        email = ADMIN_EMAIL if name == "download" else f"user{index}@{DOMAINS[index % len(DOMAINS)]}"
+        client = Client(port, email)
+        for _ in range(per_worker[index]):
+            try:
+                status, _, first_byte, total = request_fn(client, rng, args)
+            except Exception as e:
+                status, first_byte, total = repr(e), None, None
+            with lock:
+                results.append((status, first_byte, total))
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r[0] == 200]
+    totals = sorted(r[2] for r in ok)
+    first_bytes = sorted(r[1] for r in ok)
+    ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+
+    return {
+        "endpoint": name,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_statuses": sorted({str(r[0]) for r in results if r[0] != 200}),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "p50_ms": ms(percentile(totals, 50)),
+        "p95_ms": ms(percentile(totals, 95)),
+        "p99_ms": ms(percentile(totals, 99)),
+        "ttfb_p50_ms": ms(percentile(first_bytes, 50)),
+        "ttfb_p95_ms": ms(percentile(first_bytes, 95)),
+        "rss_before_mb": round(rss_before, 1) if rss_before else None,
+        "rss_after_mb": round(rss_mb(), 1) if rss_mb() else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def start_fake_openai(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fakes.py"), "--port", str(port),
+               "--error-rate", str(args.error_rate), "--token-interval", str(args.token_interval),
+               "--seed", str(args.seed)]
+    for spec in args.latency or []:
+        command += ["--latency", spec]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    wait_for_port(port)
+    return process, port
+
+
+def start_app(workdir, openai_port):
+    '''Configures the environment, imports the app with an in-memory Firestore and serves it.'''
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "ADMIN_EMAILS": ADMIN_EMAIL,
+        "SUBMISSION_SPOOL_PATH": os.path.join(workdir, "spool.jsonl"),
+        "JOB_QUEUE_URL": "sqlite:///" + os.path.join(workdir, "jobs.db"),
+        "CLASSIFIER_LOG_PATH": os.path.join(workdir, "classifier_log.jsonl"),
+        # per-user limits would turn most of a load test into 429s; set RATE_LIMITS to measure them
+        "RATE_LIMITS": os.getenv("RATE_LIMITS", ""),
+    })
+    os.chdir(REPO_ROOT)
+
+    import services
+    from fakes import InMemoryFirestore
+    services.override("firestore", InMemoryFirestore())
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    port = free_port()
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, port
+
+
+def wait_for_background():
+    '''Waits for work the app finishes after responding (model calls still running, queued grading jobs), so it
+    isn't billed to the next endpoint.
+
+    Returns the seconds spent waiting.
+    '''
+    import app
+
+    started = time.perf_counter()
+    executor = app.model_executor
+    app.model_executor = ThreadPoolExecutor(max_workers=executor._max_workers)
+    executor.shutdown(wait=True)
+    while True:
+        stats = app.job_queue.stats()
+        if not stats["queued"] and not stats["running"]:
+            break
+        time.sleep(0.1)
+    return round(time.perf_counter() - started, 2)
+
+
+def print_table(rows):
+    columns = ["endpoint", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms",
+               "ttfb_p50_ms", "background_drain_s", "peak_rss_mb"]
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="chat,clean,download")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--download-requests", type=int, default=10, help="requests for /download, which is heavy")
+    parser.add_argument("--latency", action="append",
+                        help="[model=]fixed:S | uniform:LOW:HIGH | lognormal:MEDIAN:SIGMA (repeatable)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of OpenAI calls answered with 429")
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--pitch-ratio", type=float, default=0.8, help="share of /chat messages that are pitches")
+    parser.add_argument("--clean-repeat-ratio", type=float, default=0.3, help="share of /clean texts seen before")
+    parser.add_argument("--stream", action="store_true", help="use the SSE /chat path")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    if not args.latency:
+        args.latency = ["gpt-4=lognormal:2.0:0.4", "lognormal:0.4:0.3"]
+
+    workdir = tempfile.mkdtemp(prefix="pitch-bench-")
+    openai_process, openai_port = start_fake_openai(args)
+    try:
+        server, port = start_app(workdir, openai_port)
+        from batch_writer import submission_writer
+
+        rows = []
+        for name in args.endpoints.split(","):
+            endpoint_args = argparse.Namespace(**vars(args))
+            if name == "download":
+                # let queued submissions land first so the export has the whole data set
+                submission_writer.flush()
+                endpoint_args.requests = args.download_requests
+                endpoint_args.concurrency = min(args.concurrency, args.download_requests)
+            rows.append(run_endpoint(name, port, endpoint_args))
+            rows[-1]["background_drain_s"] = wait_for_background()
+            print(f"{name}: done in {rows[-1]['seconds']}s", file=sys.stderr)
+
+        print_table(rows)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "results": rows}, f, indent=2)
+        server.shutdown()
+    finally:
+        openai_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
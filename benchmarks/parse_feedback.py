@@ -0,0 +1,119 @@
+'''
+Compares the legacy line-by-line feedback parser with the single-pass parser in feedback_parser.py.
+
+Usage: python benchmarks/parse_feedback.py [--samples 2000] [--repeat 5]
+
+Builds a corpus of evaluator outputs in the formats seen in production (bold headers, "Section:"
+headers, numbered lists, reordered sections, JSON from function calling), then reports parse time
+per output and how many sections each parser recovered, overall, for the text outputs alone (the
+formats both parsers handle) and for the JSON outputs alone.
+'''
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feedback_parser import SECTION_NAMES, extract_structured_feedback
+
+SENTENCES = [
+    "The pitch names a concrete operational cost the buyer already feels.",
+    "N/A - the pitch should describe what happens if nothing changes.",
+    "Consider quantifying the impact with a number the audience recognizes.",
+    "The relief is clear but reads like a feature list rather than an outcome.",
+    "Painful renewals are mentioned but never tied to revenue at risk.",
+]
+
+
+def legacy_extract(raw_feedback):
+    '''The parser firestore.py used before feedback_parser.py, kept here as the baseline.'''
+    raw_feedback = re.sub(r"\*\*(.*?)\*\*", r"\1", raw_feedback)
+    sections = {name: "" for name in SECTION_NAMES}
+    current_key = None
+
+    for line in raw_feedback.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        match = re.match(r"^(Pain|Threat|Belief Statement|Relief|Tone|Length|Clarity)\s*(.*)", line)
+        if match:
+            current_key = match.group(1)
+            sections[current_key] = match.group(2).strip()
+        elif current_key:
+            sections[current_key] += " " + line
+
+    return {k: v.strip() for k, v in sections.items()}
+
+
+def render(sections, style):
+    '''Formats a section dict the way the evaluator tends to write it.'''
+    if style == "json":
+        return json.dumps(sections)
+
+    lines = []
+    for i, (name, text) in enumerate(sections.items(), 1):
+        header = {
+            "plain": name,
+            "bold": f"**{name}**",
+            "colon": f"**{name}:**",
+            "numbered": f"{i}. {name} -",
+        }[style]
+        lines.append(f"{header} {text}\n")
+    return "\n".join(lines)
+
+
+def build_corpus(samples, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(samples):
+        names = list(SECTION_NAMES[:])
+        if rng.random() < 0.3:
+            rng.shuffle(names)
+        sections = {name: " ".join(rng.sample(SENTENCES, 2)) for name in names}
+        corpus.append(render(sections, rng.choice(["plain", "bold", "colon", "numbered", "json"])))
+    return corpus
+
+
+def measure(parser, corpus, repeat):
+    '''Returns (best microseconds per output, sections recovered across the corpus).'''
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [parser(raw) for raw in corpus]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    recovered = sum(1 for result in results for value in result.values() if value)
+    return best / len(corpus) * 1e6, recovered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.samples)
+    expected = len(corpus) * len(SECTION_NAMES)
+
+    for name, fn in [("legacy", legacy_extract), ("single-pass", extract_structured_feedback)]:
+        us, recovered = measure(fn, corpus, args.repeat)
+        print(f"{name:<12} {us:8.1f} us/output   {recovered}/{expected} sections recovered")
+
+    text_corpus = [raw for raw in corpus if not raw.startswith("{")]
+    for name, fn in [("legacy text", legacy_extract), ("text only", extract_structured_feedback)]:
+        us, recovered = measure(fn, text_corpus, args.repeat)
+        print(f"{name:<12} {us:8.1f} us/output   {recovered}/{len(text_corpus) * len(SECTION_NAMES)} sections recovered")
+
+    json_corpus = [raw for raw in corpus if raw.startswith("{")]
+    us, recovered = measure(extract_structured_feedback, json_corpus, args.repeat)
+    print(f"{'json only':<12} {us:8.1f} us/output   {recovered}/{len(json_corpus) * len(SECTION_NAMES)} sections recovered")
+
+
+if __name__ == "__main__":
+    main()
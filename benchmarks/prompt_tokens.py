@@ -0,0 +1,81 @@
+'''
+Compares the size of the gpt-4 evaluation prompt with every example inlined against the per-pitch prompt
+built by few-shot selection (prompt_store.system_prompt_for).
+
+Usage: python benchmarks/prompt_tokens.py [--samples 200] [--k 3] [--budget 1200]
+
+Pitches are the example pitches themselves, each graded against an index without it (so it can't pick
+itself), plus synthetic pitches from the load test. Tokens are counted with tiktoken when it is installed,
+otherwise with the four-characters-per-token estimate the scheduler uses.
+'''
+import os
+import sys
+import time
+import random
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+os.chdir(REPO_ROOT)
+
+from prompts import compile_prompts, format_example, format_examples
+from few_shot import ExampleIndex
+from load_test import make_pitch
+
+
+def token_counter():
+    '''Returns (count function, description) using tiktoken's gpt-4 encoding if available.'''
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model("gpt-4")
+        return lambda text: len(encoding.encode(text)), "tiktoken gpt-4"
+    except ImportError:
+        from model import estimate_tokens
+
+        return estimate_tokens, "estimated, ~4 chars/token"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200, help="synthetic pitches on top of the examples")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=1200)
+    args = parser.parse_args()
+
+    count, method = token_counter()
+    prompts = compile_prompts()
+    examples = prompts["examples"]
+    rubric = prompts["rubric_prompt"]
+
+    # (pitch, index to select from): held-out examples first, then synthetic pitches against the full index
+    full_index = ExampleIndex(examples, format_example)
+    cases = [(ex["content"], ExampleIndex(examples[:i] + examples[i + 1:], format_example))
+             for i, ex in enumerate(examples)]
+    rng = random.Random(7)
+    cases += [(make_pitch(rng), full_index) for _ in range(args.samples)]
+
+    sizes = []
+    chosen = []
+    started = time.perf_counter()
+    for pitch, index in cases:
+        selected = index.select(pitch, args.k, args.budget)
+        chosen.append(len(selected))
+        sizes.append(count(rubric + format_examples(selected)))
+    selection_us = (time.perf_counter() - started) / len(cases) * 1e6
+    sizes.sort()
+
+    before = count(prompts["system_prompt"])
+    mean = sum(sizes) / len(sizes)
+    print(f"prompt tokens ({method}), {len(cases)} pitches, k={args.k}, budget={args.budget}")
+    print(f"  all {len(examples)} examples inlined: {before}")
+    print(f"  selected examples:      mean {mean:.0f}  p95 {sizes[int(len(sizes) * 0.95) - 1]}  max {sizes[-1]}"
+          f"  ({(1 - mean / before) * 100:.0f}% smaller, {sum(chosen) / len(chosen):.1f} examples)")
+    print(f"  static rubric prefix:   {count(rubric)}")
+    print(f"  selection + formatting: {selection_us:.0f} us/pitch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import io
+import csv
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from firestore import save_submission, load_bulk_job, save_bulk_job
+from text_metrics import compute_text_metrics
+from prompts import prompt_store
+from scheduler import scheduler
+import services
+
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_MAX_PITCHES = int(os.getenv("BULK_MAX_PITCHES", "500"))
+
+# limiter key for OpenAI file and batch management calls, kept apart from the chat models' slots
+BATCH_LIMITER = "openai-batch"
+
+
+def parse_pitches(text, filename="", default_email="N/A"):
+    '''Reads pitches from a CSV (Email and Pitch columns) or JSONL ({"email", "pitch"} per line) upload.
+
+    Returns a list of {"email", "pitch"} dicts; rows without a pitch are skipped. Raises ValueError
+    if the file can't be parsed or holds more than BULK_MAX_PITCHES pitches.
+    '''
+    text = text.lstrip("\ufeff")
+    if filename.endswith((".jsonl", ".ndjson")) or text.lstrip().startswith("{"):
+        try:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError as e:
+            raise ValueError(f"Invalid JSONL: {e}")
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    pitches = []
+    for row in rows:
+        row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+        pitch = (row.get("pitch") or row.get("text") or "").strip()
+        if pitch:
+            pitches.append({"email": (row.get("email") or default_email).strip().lower(), "pitch": pitch})
+
+    if not pitches:
+        raise ValueError("No pitches found; expected a CSV with a Pitch column or JSONL with a \"pitch\" field")
+    if len(pitches) > BULK_MAX_PITCHES:
+        raise ValueError(f"Too many pitches ({len(pitches)}); the limit is {BULK_MAX_PITCHES}")
+    return pitches
+
+
+def evaluate_and_save(item, evaluate):
+    '''Grades one uploaded pitch with evaluate(pitch) -> (feedback, prompt version, model) and queues it for saving.'''
+    response, prompt_version, model = evaluate(item["pitch"])
+    return save_submission(item["email"], item["pitch"], response, compute_text_metrics(item["pitch"]), prompt_version,
+                           model=model)
+
+
+def run_bulk(items, evaluate, concurrency=BULK_CONCURRENCY):
+    '''Evaluates pitches concurrently and yields a progress event as each one is saved or fails.
+
+    Submissions go through the batched writer like /chat saves. If the consumer stops early
+    (e.g. the admin closes the page), pitches that haven't started are cancelled.
+    '''
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bulk")
+    futures = {pool.submit(evaluate_and_save, item, evaluate): index for index, item in enumerate(items)}
+    saved = failed = 0
+
+    try:
+        for future in as_completed(futures):
+            event = {"index": futures[future], "email": items[futures[future]]["email"]}
+            try:
+                event.update(status="saved", id=future.result())
+                saved += 1
+            except Exception as e:
+                event.update(status="error", error=str(e))
+                failed += 1
+            yield {**event, "completed": saved + failed, "total": len(items)}
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    yield {"done": True, "saved": saved, "errors": failed, "total": len(items)}
+
+
+def batch_request_lines(items, model="gpt-4", temperature=0.4, max_tokens=300):
+    '''Builds the OpenAI Batch API input: one chat completion request per pitch, keyed by its index.'''
+    prompts = prompt_store.current()
+    return [
+        json.dumps({
+            "custom_id": str(index),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": prompt_store.system_prompt_for(item["pitch"], prompts)},
+                    {"role": "user", "content": item["pitch"]}
+                ],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+        })
+        for index, item in enumerate(items)
+    ]
+
+
+def submit_openai_batch(items, max_tokens=300):
+    '''Submits the pitches as one OpenAI Batch API job (half price, finished within 24h) and returns its id.
+
+    The pitches are stored with the job so collect_openai_batch() can save the results later.
+    '''
+    client = services.get("openai")
+    data = "\n".join(batch_request_lines(items, max_tokens=max_tokens)).encode("utf-8")
+
+    upload = scheduler.run(BATCH_LIMITER, 0, lambda: client.files.create(file=("pitches.jsonl", data), purpose="batch"))
+    batch = scheduler.run(BATCH_LIMITER, 0, lambda: client.batches.create(
+        input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+    ))
+
+    save_bulk_job(batch.id, {
+        "items": items,
+        "prompt_version": prompt_store.version(),
+        "status": batch.status,
+        "created_at": datetime.now(timezone.utc),
+    })
+    return batch.id
+
+
+def collect_openai_batch(batch_id):
+    '''Saves the results of a finished Batch API job. Safe to call repeatedly; returns the job status.
+
+    Each result is saved under an id made from the batch and request ids, so concurrent or repeated
+    collects rewrite the same submissions instead of adding copies.
+    '''
+    job = load_bulk_job(batch_id)
+    if not job:
+        raise KeyError(batch_id)
+    if job.get("status") == "collected":
+        return {"status": "collected", "saved": job.get("saved", 0), "errors": job.get("errors", 0)}
+
+    client = services.get("openai")
+    batch = scheduler.run(BATCH_LIMITER, 0, lambda: client.batches.retrieve(batch_id))
+    if batch.status != "completed" or not batch.output_file_id:
+        save_bulk_job(batch_id, {"status": batch.status}, merge=True)
+        return {"status": batch.status}
+
+    output = scheduler.run(BATCH_LIMITER, 0, lambda: client.files.content(batch.output_file_id))
+    items = job["items"]
+    saved = failed = 0
+
+    for line in output.text.splitlines():
+        result = json.loads(line)
+        item = items[int(result["custom_id"])]
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            failed += 1
+            continue
+        feedback = response["body"]["choices"][0]["message"]["content"]
+        save_submission(item["email"], item["pitch"], feedback, compute_text_metrics(item["pitch"]),
+                        job.get("prompt_version"), model=response["body"].get("model"),
+                        doc_id=f"{batch_id}-{result['custom_id']}")
+        saved += 1
+
+    # requests that never produced an output line (expired or errored) count as failures
+    failed += len(items) - saved - failed
+    save_bulk_job(batch_id, {"status": "collected", "saved": saved, "errors": failed}, merge=True)
+    return {"status": "collected", "saved": saved, "errors": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a CSV or JSONL file of pitches in bulk.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    evaluate = subcommands.add_parser("evaluate", help="grade a file of pitches now, or submit it as a Batch API job")
+    evaluate.add_argument("path")
+    evaluate.add_argument("--email", default="N/A", help="email for rows that don't have one")
+    evaluate.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY)
+    evaluate.add_argument("--openai-batch", action="store_true", help="use the OpenAI Batch API (results within 24h)")
+
+    collect = subcommands.add_parser("collect", help="save the results of a finished Batch API job")
+    collect.add_argument("batch_id")
+    args = parser.parse_args()
+
+    from app import evaluate_pitch, EVALUATION_MAX_TOKENS
+    from batch_writer import submission_writer
+
+    # this process stays up until close() has flushed every queued write, so batch them in the background
+    submission_writer.write_behind = True
+
+    try:
+        if args.command == "collect":
+            print(json.dumps(collect_openai_batch(args.batch_id)))
+            return
+
+        with open(args.path, "r", encoding="utf-8") as f:
+            items = parse_pitches(f.read(), args.path, args.email)
+
+        if args.openai_batch:
+            print(f"Submitted {len(items)} pitches as batch {submit_openai_batch(items, EVALUATION_MAX_TOKENS)}")
+            print("Run `python bulk.py collect <batch id>` once it completes.")
+            return
+
+        for event in run_bulk(items, evaluate_pitch, args.concurrency):
+            print(json.dumps(event), flush=True)
+    except (ValueError, KeyError) as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        submission_writer.close()
+
+
+if __name__ == "__main__":
+    main()
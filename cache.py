@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def normalize_whitespace(text):
+    '''Collapses runs of whitespace and trims the ends.'''
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_text(text):
+    '''Collapses whitespace and case so trivially different transcripts share a cache entry.'''
+    return normalize_whitespace(text).lower()
+
+
+def make_cache_key(text, fold_case=False, **params):
+    '''Builds a content-addressed key from the whitespace-normalized text and the model parameters.
+
+    Case is kept unless fold_case is set: only use it where the output can't depend on the input's case.
+    '''
+    text = normalize_text(text) if fold_case else normalize_whitespace(text)
+    payload = json.dumps({"text": text, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteBackend:
+    '''Shared cache backend stored in a local SQLite file, usable across worker processes.'''
+
+    def __init__(self, path, max_entries=10000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            # drop expired rows, then the soonest-to-expire rows beyond the size limit
+            self.conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self.conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+
+class RedisBackend:
+    '''Shared cache backend for Redis or any server speaking the Redis protocol. Requires the redis package.'''
+
+    def __init__(self, url, prefix="cache:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, int(ttl), value)
+
+
+def backend_from_url(url):
+    '''Builds a shared backend from "sqlite:///path/to/file.db" or "redis://host:port/db"; None if unset.'''
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
+
+class ResponseCache:
+    '''In-process LRU cache with TTL, optionally backed by a shared backend consulted on local misses.'''
+
+    def __init__(self, max_entries=1024, ttl=86400, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        '''Returns the cached value for key, or None on a miss.'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self.entries[key]
+
+        value = None
+        if self.backend:
+            try:
+                value = self.backend.get(key)
+            except Exception as e:
+                print(f"Error reading shared cache: {e}")
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        '''Stores value locally and in the shared backend, if any.'''
+        with self.lock:
+            self._store(key, value)
+
+        if self.backend:
+            try:
+                self.backend.set(key, value, self.ttl)
+            except Exception as e:
+                print(f"Error writing shared cache: {e}")
+
+    def _store(self, key, value):
+        self.entries[key] = (value, time.time() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        '''Returns hit/miss counters for monitoring.'''
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    '''Coalesces concurrent calls with the same key into one execution whose result every caller shares.'''
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        '''Runs fn(*args), or waits for the identical call already in flight and returns its result.'''
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def stats(self):
+        with self.lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self.calls)}
+
+
+clean_cache = ResponseCache(
+    max_entries=int(os.getenv("CLEAN_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("CLEAN_CACHE_TTL", "86400")),
+    backend=backend_from_url(os.getenv("CLEAN_CACHE_BACKEND", "")),
+)
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import math
+import zlib
+import random
+import threading
+
+PLACEHOLDERS = ["here is my pitch", "my pitch is", "test", "sample", "coming soon", "tbd", "to be added", "n/a", "na", "none", "placeholder", "draft", "lorem ipsum", "write my pitch", "i will write my pitch", "this is my pitch", "pitch", "elevator pitch", "submit", "hello", "hi", "-", "...", "?", "!", "[your pitch here]", "[insert pitch]"]
+
+# obvious non-pitches used as negative training examples alongside logged traffic
+SEED_NON_PITCHES = [
+    "hi there", "hello, how are you today?", "good morning!", "hey, what's up?",
+    "who am I speaking with?", "what do you do?", "what can you help me with?",
+    "can you help me write my pitch?", "can you improve my pitch for me?",
+    "how long should my elevator pitch be?", "what is a priority pitch?",
+    "what's 2 + 2?", "who won the world series in 2023?", "tell me a joke",
+    "what's the weather like today?", "thanks, that was helpful", "thank you so much",
+    "ok sounds good", "I don't have a pitch yet", "I'm not sure what to say",
+    "let me think about it for a minute", "can you give me an example pitch?",
+    "how does this tool work?", "what happens to my submission?", "is this being recorded?",
+    "what's the capital of France?", "how are you doing today?", "nice to meet you",
+    "I'll come back later with my pitch", "what time is it?", "can you revise this for me?",
+    "do you like sports?", "what should I include in my pitch?", "goodbye",
+    "I would like to know what the weather forecast looks like for tomorrow in Denver",
+    "Can you explain how the grading works and what happens after I submit something here?",
+    "I'm at a workshop right now and our facilitator told us to open this page and try it out",
+    "What is the difference between a pain statement and a threat statement in this framework?",
+    "Could you recommend a good book about sales or negotiation that I could read this weekend?",
+    "I'm not ready yet, I still need to talk to my manager before I share anything with you",
+    "Please write a pitch for me about our accounting software so I can use it in my meeting",
+    "How many words should the pitch be and does it matter if I go a little bit over the limit?",
+    "My internet keeps cutting out so I might have to refresh the page and start over again",
+    "Tell me something interesting about the history of the city of Chicago and its architecture",
+]
+
+PITCH_SOURCES = ["pitch_assets/examples.yaml", "pitch_examples_updated.yaml"]
+
+CONFIDENCE_THRESHOLD = float(os.getenv("CLASSIFIER_CONFIDENCE", "0.9"))
+TRAFFIC_LOG_PATH = os.getenv("CLASSIFIER_LOG_PATH", "")
+MAX_TRAFFIC_SAMPLES = 5000
+
+
+class AffixMatcher:
+    '''Compiled prefix and suffix tries over a phrase list; matching costs O(longest phrase), not O(phrases).'''
+
+    def __init__(self, phrases):
+        self.prefixes = {}
+        self.suffixes = {}
+        for phrase in phrases:
+            self._insert(self.prefixes, phrase)
+            self._insert(self.suffixes, phrase[::-1])
+
+    @staticmethod
+    def _insert(trie, phrase):
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[None] = True
+
+    @staticmethod
+    def _walk(trie, text):
+        node = trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def matches(self, text):
+        '''True if text starts or ends with any phrase (so exact matches count too).'''
+        return self._walk(self.prefixes, text) or self._walk(self.suffixes, reversed(text))
+
+
+placeholder_matcher = AffixMatcher(PLACEHOLDERS)
+
+
+def check_placeholder(user_input):
+    '''Detects placeholder or too-short input locally. Returns a non-pitch classification, or None if undecided.'''
+    normalized = user_input.strip().lower()
+
+    if placeholder_matcher.matches(normalized) or len(normalized) < 15:
+        return {"is_pitch": False, "reason": "Placeholder"}
+
+    return None
+
+
+class HashedNgramModel:
+    '''Logistic regression over hashed word unigrams and bigrams.'''
+
+    def __init__(self, dimensions=2 ** 18):
+        self.dimensions = dimensions
+        self.weights = {}
+        self.bias = 0.0
+
+    def features(self, text):
+        tokens = re.findall(r"[a-z']+|[?!]", text.lower())
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+        indexes = {zlib.crc32(g.encode("utf-8")) % self.dimensions for g in grams}
+        value = 1 / math.sqrt(len(indexes)) if indexes else 0.0
+        return {i: value for i in indexes}
+
+    def predict_proba(self, text):
+        '''Probability that text is an elevator pitch.'''
+        z = self.bias + sum(self.weights.get(i, 0.0) * v for i, v in self.features(text).items())
+        return 1 / (1 + math.exp(-max(min(z, 30), -30)))
+
+    def fit(self, samples, epochs=40, learning_rate=0.5, l2=1e-4):
+        '''Trains on (text, is_pitch) pairs with plain SGD.'''
+        data = [(self.features(text), 1.0 if label else 0.0) for text, label in samples]
+        rng = random.Random(0)
+
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for features, label in data:
+                z = self.bias + sum(self.weights.get(i, 0.0) * v for i, v in features.items())
+                error = 1 / (1 + math.exp(-max(min(z, 30), -30))) - label
+                self.bias -= learning_rate * error
+                for i, v in features.items():
+                    w = self.weights.get(i, 0.0)
+                    self.weights[i] = w - learning_rate * (error * v + l2 * w)
+        return self
+
+
+def load_pitch_examples():
+    '''Grabs example pitch texts from the pitch asset files, plus each paragraph on its own.'''
+    import yaml
+
+    texts = []
+    for path in PITCH_SOURCES:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f"Warning: Could not load {path}: {e}")
+            continue
+
+        for pitch in data.get("pitches", []):
+            content = pitch.get("content", "").strip()
+            if not content:
+                continue
+            texts.append(content)
+            texts.extend(p.strip() for p in content.split("\n\n") if len(p.split()) >= 12)
+    return texts
+
+
+def load_logged_traffic(path=TRAFFIC_LOG_PATH):
+    '''Grabs (text, is_pitch) pairs previously labeled by the LLM classifier.'''
+    if not path or not os.path.exists(path):
+        return []
+
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                samples.append((record["text"], bool(record["is_pitch"])))
+            except (ValueError, KeyError):
+                continue
+    return samples[-MAX_TRAFFIC_SAMPLES:]
+
+
+def log_classification(text, is_pitch, path=TRAFFIC_LOG_PATH):
+    '''Records an LLM classification so the local model can learn from it on the next training run.'''
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"text": text, "is_pitch": bool(is_pitch)}) + "\n")
+    except OSError as e:
+        print(f"Warning: Could not log classification: {e}")
+
+
+class LocalClassifier:
+    '''Decides clear-cut inputs locally and reports which ones need the LLM.'''
+
+    def __init__(self, threshold=CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.model = None
+        self.lock = threading.Lock()
+        self.counts = {"placeholder": 0, "local_pitch": 0, "local_non_pitch": 0, "escalated": 0}
+        self.guesses = 0
+
+    def ensure_trained(self):
+        '''Trains the lexical model on first use.'''
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    samples = [(text, True) for text in load_pitch_examples()]
+                    samples += [(text, False) for text in SEED_NON_PITCHES]
+                    samples += load_logged_traffic()
+                    self.model = HashedNgramModel().fit(samples)
+        return self.model
+
+    def classify(self, user_input):
+        '''Returns a classification dict when confident, or None if the input should go to the LLM.'''
+        placeholder = check_placeholder(user_input)
+        if placeholder:
+            self.counts["placeholder"] += 1
+            return placeholder
+
+        probability = self.ensure_trained().predict_proba(user_input)
+
+        if probability >= self.threshold:
+            self.counts["local_pitch"] += 1
+            return {"is_pitch": True, "reason": "PitchLike", "source": "local", "confidence": probability}
+        if probability <= 1 - self.threshold:
+            self.counts["local_non_pitch"] += 1
+            return {"is_pitch": False, "reason": "Other", "source": "local", "confidence": 1 - probability}
+
+        self.counts["escalated"] += 1
+        return None
+
+    def guess(self, user_input):
+        '''Classifies an escalated input without the LLM (e.g. when OpenAI is down), at a plain 0.5 threshold.'''
+        probability = self.ensure_trained().predict_proba(user_input)
+        self.guesses += 1
+        is_pitch = probability >= 0.5
+        return {"is_pitch": is_pitch, "reason": "Fallback", "source": "local",
+                "confidence": probability if is_pitch else 1 - probability}
+
+    def stats(self):
+        '''Returns decision counters and the share of inputs escalated to the LLM.'''
+        total = sum(self.counts.values())
+        return {**self.counts, "llm_unavailable_guesses": self.guesses,
+                "escalation_rate": self.counts["escalated"] / total if total else 0.0}
+
+
+local_classifier = LocalClassifier()
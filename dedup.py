@@ -0,0 +1,182 @@
+import os
+import re
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from cache import normalize_text
+from firestore import submission_collections, stream_submissions_since
+from batch_writer import submission_writer
+
+# most recent submissions kept in memory across all users and domains
+INDEX_SIZE = int(os.getenv("DEDUP_INDEX_SIZE", "5000"))
+# estimated shingle overlap (Jaccard similarity) at which two pitches count as near-duplicates
+NEAR_SIMILARITY = float(os.getenv("DEDUP_NEAR_SIMILARITY", "0.7"))
+# how far back the startup rebuild reads from Firestore
+REBUILD_DAYS = int(os.getenv("DEDUP_REBUILD_DAYS", "90"))
+
+SHINGLE_SIZE = 3
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+# MinHash signature of NUM_PERM values, split into BANDS buckets of ROWS values for candidate lookup;
+# pitches with 0.7 overlap share at least one bucket ~99% of the time, unrelated ones almost never
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+def exact_fingerprint(text):
+    '''Hash of the pitch with case and whitespace normalized, so trivially different resubmissions match.'''
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def shingles(text):
+    '''Overlapping word 3-grams of the pitch, ignoring punctuation.'''
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    '''MinHash signature of the pitch shingles; the share of equal values estimates their Jaccard similarity.'''
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+              for s in shingles(text)]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+def similarity(first, second):
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+class SubmissionIndex:
+    '''Bounded in-memory index of recent submissions per user and domain, for exact and near-duplicate lookups.
+
+    Entries are evicted least recently used first. New submissions are added by a batched-writer
+    hook as they are committed; the first lookup starts a background rebuild from Firestore, so
+    importing the app never waits on (or loads) the Firestore client.
+    '''
+
+    def __init__(self, max_entries=INDEX_SIZE, near_similarity=NEAR_SIMILARITY):
+        self.max_entries = max_entries
+        self.near_similarity = near_similarity
+        self.entries = OrderedDict()
+        # per (domain, email): LSH band -> keys of the entries whose signature falls in it
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.metrics = {"exact_hits": 0, "near_hits": 0, "misses": 0, "rebuilt": 0}
+
+    def add(self, domain, doc_id, entry):
+        '''Indexes one stored submission (the dict written to Firestore).'''
+        pitch = entry.get("pitch", "")
+        if not pitch or not entry.get("feedback"):
+            return
+
+        owner = (domain, entry.get("email"))
+        key = (*owner, exact_fingerprint(pitch))
+        indexed = {
+            "id": doc_id,
+            "email": entry.get("email"),
+            "signature": minhash(pitch),
+            "feedback": entry["feedback"],
+            "prompt_version": entry.get("prompt_version"),
+            "model": entry.get("model"),
+        }
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = indexed
+            buckets = self.buckets.setdefault(owner, {})
+            for band in band_keys(indexed["signature"]):
+                buckets.setdefault(band, set()).add(key)
+
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        indexed = self.entries.pop(key)
+        buckets = self.buckets[key[:2]]
+        for band in band_keys(indexed["signature"]):
+            keys = buckets.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del buckets[band]
+        if not buckets:
+            del self.buckets[key[:2]]
+
+    def lookup(self, domain, email, text):
+        '''Finds a prior submission by the same user in the domain with the same or nearly the same pitch.
+
+        Returns {"kind": "exact" or "near", "similarity", "id", "email", "feedback", "prompt_version", "model"},
+        or None.
+        '''
+        self.start()
+        key = (domain, email, exact_fingerprint(text))
+        with self.lock:
+            indexed = self.entries.get(key)
+            if indexed is not None:
+                self.entries.move_to_end(key)
+                self.metrics["exact_hits"] += 1
+                return {"kind": "exact", "similarity": 1.0, **indexed}
+
+        signature = minhash(text)
+        with self.lock:
+            buckets = self.buckets.get((domain, email), {})
+            candidates = {k for band in band_keys(signature) for k in buckets.get(band, ())}
+            candidates = [self.entries[k] for k in candidates]
+
+        best, best_similarity = None, self.near_similarity
+        for candidate in candidates:
+            score = similarity(signature, candidate["signature"])
+            if score >= best_similarity:
+                best, best_similarity = candidate, score
+
+        if best is None:
+            self.metrics["misses"] += 1
+            return None
+        self.metrics["near_hits"] += 1
+        return {"kind": "near", "similarity": round(best_similarity, 3), **best}
+
+    def rebuild(self, days=REBUILD_DAYS):
+        '''Loads the last `days` of submissions from every domain collection, oldest first.'''
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        for col in submission_collections():
+            try:
+                for entry in stream_submissions_since(col, since):
+                    self.add(col.id, entry.get("id"), entry)
+                    self.metrics["rebuilt"] += 1
+            except Exception as e:
+                print(f"Error indexing collection {col.id}: {e}")
+
+    def start(self):
+        '''Rebuilds the index in a background thread so startup isn't blocked on Firestore.'''
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.rebuild, name="dedup-rebuild", daemon=True)
+                self.thread.start()
+
+    def stats(self):
+        return {**self.metrics, "entries": len(self.entries), "users": len(self.buckets),
+                "domains": len({domain for domain, _ in self.buckets})}
+
+
+def index_batch_hook(client, batch, records):
+    '''Batched-writer hook: indexes submissions as they are committed.'''
+    for record in records:
+        if not record["collection"].startswith("_"):
+            submission_index.add(record["collection"], record["id"], record["data"])
+
+
+submission_index = SubmissionIndex()
+submission_writer.add_batch_hook(index_batch_hook)
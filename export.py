@@ -0,0 +1,182 @@
+import os
+import sys
+import importlib.util
+from itertools import islice
+from firestore import stream_all_submissions
+from feedback_parser import extract_structured_feedback, SECTION_NAMES
+from aggregates import is_missing
+from text_metrics import compute_text_metrics
+
+# rows per Parquet row group / Arrow record batch; only one group is held in memory while exporting
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "5000"))
+
+# format: (mimetype, file extension); both need the optional pyarrow package
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# text_metrics values exported as numeric columns: (name, Arrow type name)
+METRIC_COLUMNS = [
+    ("word_count", "int32"),
+    ("sentence_count", "int32"),
+    ("avg_sentence_words", "float32"),
+    ("reading_grade", "float32"),
+    ("you_ratio", "float32"),
+    ("first_person_ratio", "float32"),
+]
+
+
+def section_column(name):
+    '''Column name for a feedback section, e.g. "Belief Statement" -> "belief_statement".'''
+    return name.lower().replace(" ", "_")
+
+
+def pyarrow_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_schema():
+    '''Arrow schema of the export: one row per submission with its feedback sections and derived columns.'''
+    import pyarrow as pa
+
+    fields = [
+        ("id", pa.string()),
+        ("domain", pa.string()),
+        ("email", pa.string()),
+        ("submitted_at", pa.timestamp("us", tz="UTC")),
+        ("prompt_version", pa.string()),
+        ("model", pa.string()),
+        ("pitch", pa.string()),
+    ]
+    fields += [(section_column(name), pa.string()) for name in SECTION_NAMES]
+    fields += [(f"has_{section_column(name)}", pa.bool_()) for name in SECTION_NAMES]
+    fields.append(("sections_present", pa.int8()))
+    fields += [(name, getattr(pa, kind)()) for name, kind in METRIC_COLUMNS]
+    fields += [("duplicate_kind", pa.string()), ("duplicate_of", pa.string()), ("duplicate_similarity", pa.float32())]
+    return pa.schema(fields)
+
+
+def submission_columns(entries):
+    '''Flattens stored submissions into {column: values}, deriving the flag and metric columns.
+
+    Feedback saved as raw evaluator text is parsed with extract_structured_feedback, and submissions
+    saved before text metrics were stored get them computed from the pitch.
+    '''
+    columns = {name: [] for name in export_schema().names}
+
+    for entry in entries:
+        feedback = entry.get("feedback") or {}
+        if isinstance(feedback, str):
+            feedback = extract_structured_feedback(feedback)
+        metrics = entry.get("metrics") or compute_text_metrics(entry.get("pitch", ""))
+        duplicate = entry.get("duplicate") or {}
+
+        columns["id"].append(entry.get("id"))
+        columns["domain"].append(entry.get("domain"))
+        columns["email"].append(entry.get("email"))
+        columns["submitted_at"].append(entry.get("submitted_at"))
+        columns["prompt_version"].append(entry.get("prompt_version"))
+        columns["model"].append(entry.get("model"))
+        columns["pitch"].append(entry.get("pitch", ""))
+
+        present = 0
+        for name in SECTION_NAMES:
+            text = feedback.get(name) or ""
+            columns[section_column(name)].append(text)
+            columns[f"has_{section_column(name)}"].append(not is_missing(text))
+            present += not is_missing(text)
+        columns["sections_present"].append(present)
+
+        for name, _ in METRIC_COLUMNS:
+            columns[name].append(metrics.get(name))
+        columns["duplicate_kind"].append(duplicate.get("kind"))
+        columns["duplicate_of"].append(duplicate.get("of"))
+        columns["duplicate_similarity"].append(duplicate.get("similarity"))
+
+    return columns
+
+
+def iter_record_batches(entries, batch_size=EXPORT_ROW_GROUP_SIZE):
+    '''Yields the submissions as Arrow record batches of at most batch_size rows.'''
+    import pyarrow as pa
+
+    schema = export_schema()
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, batch_size))
+        if not chunk:
+            return
+        columns = submission_columns(chunk)
+        yield pa.record_batch([pa.array(columns[name], type=schema.field(name).type) for name in schema.names],
+                              schema=schema)
+
+
+class ChunkSink:
+    '''Write-only file object that hands back what's been written since the last drain().
+
+    Lets the Parquet and Arrow writers stream a response a row group at a time.
+    '''
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export(entries, fmt, batch_size=EXPORT_ROW_GROUP_SIZE):
+    '''Yields a Parquet file or Arrow IPC stream of the submissions in chunks, one row group at a time.'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    schema = export_schema()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+
+    for batch in iter_record_batches(entries, batch_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+
+    # the Parquet footer (schema and row group offsets) is only written on close
+    writer.close()
+    yield sink.drain()
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in EXPORT_FORMATS:
+        sys.exit(f"Usage: python export.py {{{'|'.join(EXPORT_FORMATS)}}} <output path>")
+    if not pyarrow_available():
+        sys.exit("Error: columnar exports need the pyarrow package (pip install pyarrow)")
+
+    fmt, path = sys.argv[1:]
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in stream_export(stream_all_submissions(), fmt):
+            written += f.write(chunk)
+    print(f"Wrote {written} bytes to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import re
+import json
+
+# feedback sections stored on every submission, in display order
+SECTION_NAMES = ["Pain", "Threat", "Belief Statement", "Relief", "Tone", "Length", "Clarity"]
+
+# variants the model writes instead of the canonical section name
+SECTION_ALIASES = {name.lower(): name for name in SECTION_NAMES}
+SECTION_ALIASES.update({"belief": "Belief Statement", "beliefs": "Belief Statement"})
+
+# a section header at the start of a line, tolerating markdown (bullets, numbering, headings, bold)
+# and an optional ":" / "-" separator, e.g. "**Belief Statement:** ..." or "3. Relief - ..."
+# matching the newline before it (instead of ^ with MULTILINE) lets the regex engine jump from
+# newline to newline rather than trying a match at every character
+HEADER_RE = re.compile(
+    r"\n[ \t>#*_\-•]*(?:\d+[.)][ \t]*)?[*_]*"
+    r"(belief statement|beliefs?|pain|threat|relief|tone|length|clarity)\b"
+    r"[*_]*[ \t]*(?:[:\-–—][ \t]*)?[*_]*[ \t]*",
+    re.IGNORECASE,
+)
+
+parse_stats = {"json": 0, "text": 0, "json_failures": 0, "text_failures": 0}
+
+
+def parse_text_feedback(raw_feedback):
+    '''Parses "Section text" formatted feedback by splitting it on section headers in one pass.'''
+    sections = dict.fromkeys(SECTION_NAMES, "")
+    # [text before the first header, header name, section text, header name, section text, ...]
+    pieces = HEADER_RE.split("\n" + raw_feedback)
+
+    for i in range(1, len(pieces), 2):
+        name = SECTION_ALIASES[pieces[i].lower()]
+        text = pieces[i + 1].replace("**", "").replace("\n", " ").strip()
+        if "  " in text or "\t" in text or "\r" in text:
+            text = " ".join(text.split())
+        sections[name] = f"{sections[name]} {text}".strip() if sections[name] else text
+
+    return sections, len(pieces) > 1
+
+
+def parse_json_feedback(raw_feedback):
+    '''Loads JSON structured feedback (from function calling) into the section dict, or None if invalid.'''
+    try:
+        data = json.loads(raw_feedback) if isinstance(raw_feedback, str) else raw_feedback
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    sections = {name: "" for name in SECTION_NAMES}
+    for key, value in data.items():
+        name = SECTION_ALIASES.get(key.replace("_", " ").lower())
+        if name and value is not None:
+            sections[name] = str(value).strip()
+    return sections
+
+
+def extract_structured_feedback(raw_feedback):
+    '''Extracts the AI models evaluation of a user submitted pitch, from JSON or the text format.'''
+    if raw_feedback is None:
+        parse_stats["text_failures"] += 1
+        return {name: "" for name in SECTION_NAMES}
+
+    if isinstance(raw_feedback, dict) or raw_feedback.lstrip().startswith("{"):
+        sections = parse_json_feedback(raw_feedback)
+        if sections is not None:
+            parse_stats["json"] += 1
+            return sections
+        parse_stats["json_failures"] += 1
+        if isinstance(raw_feedback, dict):
+            return {name: "" for name in SECTION_NAMES}
+
+    sections, found = parse_text_feedback(raw_feedback)
+    parse_stats["text" if found else "text_failures"] += 1
+    return sections
+
+
+def evaluation_tool(sections):
+    '''OpenAI function definition asking for one string per evaluated section.'''
+    return {
+        "type": "function",
+        "function": {
+            "name": "record_evaluation",
+            "description": "Record the evaluation of an elevator pitch, one entry per section. Use \"N/A\" plus what should have been included when a section is missing.",
+            "parameters": {
+                "type": "object",
+                "properties": {name: {"type": "string"} for name in sections},
+                "required": list(sections),
+            },
+        },
+    }
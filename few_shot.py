@@ -0,0 +1,85 @@
+import os
+import re
+import math
+from collections import Counter
+from model import estimate_tokens
+
+# examples put in each evaluation prompt; 0 inlines every example, as before
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "3"))
+# most tokens the chosen examples may add to the prompt
+FEW_SHOT_TOKEN_BUDGET = int(os.getenv("FEW_SHOT_TOKEN_BUDGET", "1200"))
+
+# the audience line is short but says the most about who a pitch is for, so its words count extra
+AUDIENCE_WEIGHT = 3
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("""
+    a an and are as at be but by can do for from has have how if in into is it its just more not of on or our
+    so than that the their them they this to was we what when where which who will with you you're your
+""".split())
+
+
+def terms(text):
+    '''Lowercased words of text, without stopwords.'''
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def example_type(example):
+    return example.get("evaluation", {}).get("type", "").lower()
+
+
+class ExampleIndex:
+    '''Local TF-IDF index over the example pitches and their audiences, used to pick the few most like a submission.
+
+    Built once per prompt version from the compiled examples; selecting for a pitch takes well under a
+    millisecond and needs no network call.
+    '''
+
+    def __init__(self, examples, format_example):
+        self.examples = examples
+        self.tokens = [estimate_tokens(format_example(ex)) for ex in examples]
+
+        documents = []
+        for ex in examples:
+            counts = Counter(terms(f"{ex.get('title', '')} {ex.get('content', '')}"))
+            for term in terms(ex.get("audience", "")):
+                counts[term] += AUDIENCE_WEIGHT
+            documents.append(counts)
+
+        frequencies = Counter(term for counts in documents for term in counts)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + df)) + 1 for term, df in frequencies.items()}
+        self.vectors = [self.vectorize(counts) for counts in documents]
+
+    def vectorize(self, counts):
+        '''Unit-length TF-IDF vector of term counts; terms no example uses are dropped.'''
+        vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def select(self, pitch, k=FEW_SHOT_K, token_budget=FEW_SHOT_TOKEN_BUDGET):
+        '''Returns up to k examples most similar to the pitch whose formatted size fits the token budget.
+
+        The closest example of each grade (good, ok, bad) is taken first so the evaluator always sees
+        the contrast between them, then the closest remaining ones. Examples keep their file order.
+        '''
+        query = self.vectorize(Counter(terms(pitch)))
+        scores = [sum(w * vector.get(term, 0.0) for term, w in query.items()) for vector in self.vectors]
+        ranked = sorted(range(len(self.examples)), key=lambda i: -scores[i])
+
+        grades = set()
+        order = []
+        for i in ranked:
+            if example_type(self.examples[i]) not in grades:
+                grades.add(example_type(self.examples[i]))
+                order.append(i)
+        order += [i for i in ranked if i not in order]
+
+        chosen = []
+        used = 0
+        for i in order:
+            if len(chosen) >= k:
+                break
+            if used + self.tokens[i] <= token_budget:
+                chosen.append(i)
+                used += self.tokens[i]
+        return [self.examples[i] for i in sorted(chosen)]
@@ -1,27 +1,32 @@
 import os
-import re
+import sys
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime
-# from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from text_metrics import prescore_feedback
+from feedback_parser import extract_structured_feedback, SECTION_NAMES
+import services
+from batch_writer import submission_writer, SERVER_TIMESTAMP
 
-if not firebase_admin._apps:
-    firebase_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
 
-    if firebase_json:
-        print("Using Firebase credentials from environment variable")
+def get_db():
+    '''Returns the Firestore client, initializing Firebase on first use.'''
+    return services.get("firestore")
 
-        parsed_json = json.loads(firebase_json)  
 
-        cred = credentials.Certificate(parsed_json)
-    else:
-        print("Using local Firebase credentials file")
-        cred = credentials.Certificate("credentials/firebase-adminsdk.json")
+def firestore_api():
+    '''Returns the firebase_admin.firestore module (SERVER_TIMESTAMP, FieldFilter, ...), imported on first use.'''
+    from firebase_admin import firestore
+    return firestore
 
-    firebase_admin.initialize_app(cred)
 
-db = firestore.client()
+# number of documents requested per page when streaming a collection
+SUBMISSION_PAGE_SIZE = int(os.getenv("SUBMISSION_PAGE_SIZE", "500"))
+
+# collections whose names start with this prefix hold app metadata, not submissions
+INTERNAL_PREFIX = "_"
+SUMMARY_COLLECTION = "_summaries"
+SUMMARY_STATE_DOC = "_root"
+BULK_JOBS_COLLECTION = "_bulk_jobs"
 
 
 def get_domain(email):
@@ -29,39 +34,16 @@ def get_domain(email):
     return email.split('@')[-1].lower().replace('.', '_')
 
 
-def extract_structured_feedback(raw_feedback):
-    '''Extracts the AI models evaluation of a user submitted pitch.'''
-    raw_feedback = re.sub(r"\*\*(.*?)\*\*", r"\1", raw_feedback)
-
-    sections = {
-        "Pain": "",
-        "Threat": "",
-        "Belief Statement": "",
-        "Relief": "",
-        "Tone": "",
-        "Length": "",
-        "Clarity": ""
-    }
-
-    current_key = None
-
-    for line in raw_feedback.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-
-        match = re.match(r"^(Pain|Threat|Belief Statement|Relief|Tone|Length|Clarity)\s*(.*)", line)
-        if match:
-            current_key = match.group(1)
-            sections[current_key] = match.group(2).strip()
-        elif current_key:
-            sections[current_key] += " " + line
-
-    return {k: v.strip() for k, v in sections.items()}
+def save_submission(email, pitch_text, feedback, metrics=None, prompt_version=None, duplicate=None, model=None,
+                    doc_id=None):
+    '''Saves email, users submitted pitch, and AI evaluation feedback merged with the locally scored sections.
 
-
-def save_submission(email, pitch_text, feedback):
-    '''Saves email, users submitted pitch, and AI evaluation feedback.'''
+    duplicate ({"kind", "of", "similarity"}) marks a resubmission of an earlier pitch (see dedup.py), and
+    model is the model that wrote the feedback, which differs from gpt-4 when a fallback answered.
+    Passing a doc_id makes saving again overwrite the same document (e.g. when a job is retried).
+    The write goes through the batched writer, which commits it before returning unless write-behind is on
+    (see batch_writer.py); returns the new document id.
+    '''
     domain = get_domain(email)
     structured_feedback = extract_structured_feedback(feedback)
 
@@ -69,25 +51,186 @@ def save_submission(email, pitch_text, feedback):
         "email": email,
         "pitch": pitch_text.strip(),
         "feedback": structured_feedback,
-        "submitted_at": firestore.SERVER_TIMESTAMP
+        "submitted_at": SERVER_TIMESTAMP
     }
 
+    if metrics:
+        structured_feedback.update(prescore_feedback(metrics))
+        entry["metrics"] = metrics
+    if prompt_version:
+        entry["prompt_version"] = prompt_version
+    if duplicate:
+        entry["duplicate"] = duplicate
+    if model:
+        entry["model"] = model
+
     # store in Firestore in a collection named after the domain
-    db.collection(domain).add(entry)
+    return submission_writer.enqueue(domain, entry, doc_id)
 
 
 def fetch_all_submissions():
     '''Grabs all submissions stored in Firestore DB.'''
-    all_data = []
+    return list(stream_all_submissions())
 
-    collections = db.collections()
 
-    for col in collections:
+def stream_all_submissions(page_size=SUBMISSION_PAGE_SIZE):
+    '''Yields every stored submission (with its "domain" collection), paging through each collection with query cursors.'''
+    for col in submission_collections():
         try:
-            for doc in col.stream():
-                data = doc.to_dict()
-                all_data.append(data)
+            yield from ({"domain": col.id, **entry} for entry in stream_collection(col, page_size))
         except Exception as e:
             print(f"Error reading from collection {col.id}: {e}")
 
-    return all_data
\ No newline at end of file
+
+def submission_collections():
+    '''Yields the per-domain submission collections, skipping internal metadata collections.'''
+    for col in get_db().collections():
+        if not col.id.startswith(INTERNAL_PREFIX):
+            yield col
+
+
+def stream_submissions_since(col, checkpoint=None, page_size=SUBMISSION_PAGE_SIZE):
+    '''Yields a collection's submissions newer than checkpoint, oldest first.'''
+    query = col
+    if checkpoint:
+        query = query.where(filter=firestore_api().FieldFilter("submitted_at", ">", checkpoint))
+    yield from stream_collection(col, page_size, query.order_by("submitted_at"))
+
+
+def stream_collection(col, page_size=SUBMISSION_PAGE_SIZE, query=None):
+    '''Yields the documents of one collection (with their "id") a page at a time so only one page is held in memory.'''
+    query = (query or col.order_by("__name__")).limit(page_size)
+    last_doc = None
+
+    while True:
+        page = query.start_after(last_doc) if last_doc else query
+        docs = list(page.stream())
+
+        for doc in docs:
+            yield {"id": doc.id, **doc.to_dict()}
+
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def submissions_query(col, email=None, since=None, until=None, descending=True):
+    '''Builds the query behind one page of the submissions API: optional email and date range filters,
+    ordered by submitted_at with the document id as tie-breaker.
+
+    Filtering on email while ordering by submitted_at needs the composite index from submission_indexes().
+    '''
+    api = firestore_api()
+    direction = api.Query.DESCENDING if descending else api.Query.ASCENDING
+
+    query = col
+    if email:
+        query = query.where(filter=api.FieldFilter("email", "==", email))
+    if since:
+        query = query.where(filter=api.FieldFilter("submitted_at", ">=", since))
+    if until:
+        query = query.where(filter=api.FieldFilter("submitted_at", "<", until))
+    return query.order_by("submitted_at", direction=direction).order_by("__name__", direction=direction)
+
+
+def fetch_submissions_page(domains, email=None, since=None, until=None, descending=True, limit=50, cursor=None):
+    '''Grabs one page of submissions from the given domain collections, ordered by (submitted_at, domain, id).
+
+    cursor is the (submitted_at, domain, id) of the last entry on the previous page. Each collection is
+    read with one indexed query of at most limit + 1 documents starting at the cursor and the results are
+    merged, so a single-domain page is a single query. Returns (entries, cursor for the next page or None).
+    '''
+    entries = []
+    for domain in domains:
+        query = submissions_query(get_db().collection(domain), email, since, until, descending)
+        if cursor:
+            at, cursor_domain, cursor_id = cursor
+            if domain == cursor_domain:
+                query = query.start_after({"submitted_at": at, "__name__": cursor_id})
+            elif (domain > cursor_domain) != descending:
+                # this collection sorts after the cursor's, so its entries at the cursor's exact time are still ahead
+                query = query.start_at({"submitted_at": at})
+            else:
+                query = query.start_after({"submitted_at": at})
+
+        entries.extend({"id": doc.id, "domain": domain, **doc.to_dict()} for doc in query.limit(limit + 1).stream())
+
+    entries.sort(key=lambda e: (e["submitted_at"], e["domain"], e["id"]), reverse=descending)
+    if len(entries) <= limit:
+        return entries, None
+
+    page = entries[:limit]
+    return page, (page[-1]["submitted_at"], page[-1]["domain"], page[-1]["id"])
+
+
+def submission_indexes(domains):
+    '''Composite index definitions (firestore.indexes.json) the submissions API needs for these domains.
+
+    Collections are named per domain, so a new domain needs its indexes deployed before email filters on it work.
+    '''
+    return {
+        "indexes": [
+            {
+                "collectionGroup": domain,
+                "queryScope": "COLLECTION",
+                "fields": [
+                    {"fieldPath": "email", "order": "ASCENDING"},
+                    {"fieldPath": "submitted_at", "order": order},
+                ],
+            }
+            for domain in domains
+            for order in ("ASCENDING", "DESCENDING")
+        ],
+        "fieldOverrides": [],
+    }
+
+
+def load_summary_state():
+    '''Grabs the cached weakness summary and its checkpoint, or an empty dict if none exists.'''
+    snapshot = get_db().collection(SUMMARY_COLLECTION).document(SUMMARY_STATE_DOC).get()
+    return snapshot.to_dict() if snapshot.exists else {}
+
+
+def save_summary_state(state):
+    '''Stores the cached weakness summary and its checkpoint.'''
+    get_db().collection(SUMMARY_COLLECTION).document(SUMMARY_STATE_DOC).set(state)
+
+
+def load_partial_summary(key):
+    '''Grabs one stored partial summary (a domain or a domain/day batch) by key.'''
+    snapshot = get_db().collection(SUMMARY_COLLECTION).document(key).get()
+    return snapshot.to_dict() if snapshot.exists else {}
+
+
+def save_partial_summaries(states):
+    '''Stores several partial summaries ({key: data}) in one batch, so either all of them are saved or none.'''
+    db = get_db()
+    batch = db.batch()
+    for key, data in states.items():
+        batch.set(db.collection(SUMMARY_COLLECTION).document(key), data)
+    batch.commit()
+
+
+def load_partial_summaries(kind, domain=None):
+    '''Grabs stored partial summaries of one kind ("day" or "domain"), optionally for one domain.'''
+    query = get_db().collection(SUMMARY_COLLECTION).where(filter=firestore_api().FieldFilter("kind", "==", kind))
+    if domain:
+        query = query.where(filter=firestore_api().FieldFilter("domain", "==", domain))
+    return [doc.to_dict() for doc in query.stream()]
+
+
+def load_bulk_job(job_id):
+    '''Grabs a bulk evaluation job (an OpenAI Batch API submission) by id, or an empty dict if none exists.'''
+    snapshot = get_db().collection(BULK_JOBS_COLLECTION).document(job_id).get()
+    return snapshot.to_dict() if snapshot.exists else {}
+
+
+def save_bulk_job(job_id, data, merge=False):
+    '''Stores a bulk evaluation job.'''
+    get_db().collection(BULK_JOBS_COLLECTION).document(job_id).set(data, merge=merge)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["indexes"]:
+        sys.exit("Usage: python firestore.py indexes > firestore.indexes.json")
+    print(json.dumps(submission_indexes(sorted(col.id for col in submission_collections())), indent=2))
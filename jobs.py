@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import tempfile
+import threading
+import traceback
+
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "pitch_jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "2.0"))
+JOB_MAX_RETRY_DELAY = 60.0
+# a running job whose worker hasn't finished it within the lease (e.g. the process died) is run again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# idle workers check for retries that came due (and jobs enqueued by other processes) this often
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# finished jobs, and with them their idempotency keys, are deleted after this many seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+JOB_PURGE_INTERVAL = 600
+
+FINISHED = ("succeeded", "failed")
+
+
+class SQLiteJobStore:
+    '''Jobs in a local SQLite file, shared by every worker process on the host.
+
+    A job is "queued" until a worker claims it, "running" while leased to a worker, and ends "succeeded"
+    or "failed". Claiming pushes run_at to the end of the lease, so a job whose worker died is claimed
+    again once its lease runs out. Another store (e.g. over a message broker) only needs the same methods.
+    '''
+
+    COLUMNS = ("id", "kind", "idempotency_key", "owner", "payload", "status", "attempts", "run_at",
+               "result", "error", "created_at", "updated_at")
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, idempotency_key TEXT UNIQUE, "
+            "owner TEXT, payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "run_at REAL NOT NULL, result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at)")
+
+    def row_to_job(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def select(self, where, args):
+        row = self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE {where}", args).fetchone()
+        return self.row_to_job(row) if row else None
+
+    def add(self, job_id, kind, payload, owner=None, key=None):
+        '''Inserts a queued job. Returns (job, created); with a key already in use, returns that job instead.'''
+        now = time.time()
+        with self.lock:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, idempotency_key, owner, payload, status, run_at, created_at, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, key, owner, json.dumps(payload), now, now, now)
+            ).rowcount
+            if inserted:
+                return self.select("id = ?", (job_id,)), True
+            return self.select("idempotency_key = ?", (key,)), False
+
+    def claim(self, lease):
+        '''Leases the next job that is due to the caller, counting an attempt. Returns None if none is due.'''
+        now = time.time()
+        with self.lock:
+            # an immediate transaction keeps two processes from claiming the same job
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self.select("status IN ('queued', 'running') AND run_at <= ? ORDER BY run_at LIMIT 1", (now,))
+                if job:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, run_at = ?, updated_at = ? "
+                        "WHERE id = ?", (now + lease, now, job["id"])
+                    )
+                    job.update(status="running", attempts=job["attempts"] + 1)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job
+
+    def update(self, job_id, status, run_at=None, result=None, error=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, run_at = COALESCE(?, run_at), result = ?, error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, run_at, json.dumps(result) if result is not None else None, error, now, job_id)
+            )
+
+    def complete(self, job_id, result):
+        self.update(job_id, "succeeded", result=result)
+
+    def retry(self, job_id, error, delay):
+        self.update(job_id, "queued", run_at=time.time() + delay, error=error)
+
+    def fail(self, job_id, error):
+        self.update(job_id, "failed", error=error)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.select("id = ?", (job_id,))
+
+    def counts(self):
+        '''Returns {status: number of jobs}.'''
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def purge(self, before):
+        '''Deletes jobs that finished before the given time and returns how many were deleted.'''
+        with self.lock:
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (*FINISHED, before)
+            ).rowcount
+
+
+def job_store_from_url(url):
+    '''Builds a job store from "sqlite:///path/to/file.db".'''
+    if url.startswith("sqlite:///"):
+        return SQLiteJobStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported job queue backend: {url}")
+
+
+def retry_delay(attempt):
+    '''Exponential backoff with jitter after the given (1-based) attempt failed.'''
+    delay = min(JOB_MAX_RETRY_DELAY, JOB_RETRY_DELAY * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class JobQueue:
+    '''Durable background jobs run by a pool of worker threads, retried with backoff until they succeed.
+
+    Handlers are registered per job kind and called with the job dict; whatever JSON-serializable value
+    they return is stored as the job's result. A handler that raises is retried until max_attempts, so
+    handlers must be safe to run more than once for the same job (e.g. write documents under the job id).
+    '''
+
+    def __init__(self, store_factory, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS, lease=JOB_LEASE_SECONDS,
+                 poll_interval=JOB_POLL_INTERVAL, retention=JOB_RETENTION):
+        self.store_factory = store_factory
+        self._store = None
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.handlers = {}
+        self.threads = []
+        self.stopping = False
+        self.start_lock = threading.Lock()
+        # bumped on every enqueue so an idle worker never sleeps through a job added while it was looking
+        self.wakeup = threading.Condition()
+        self.generation = 0
+        self.last_purge = 0.0
+        self.metrics_lock = threading.Lock()
+        self.metrics = {"enqueued": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "retried": 0, "purged": 0}
+
+    @property
+    def store(self):
+        # the database file is only opened once the queue is used
+        if self._store is None:
+            with self.start_lock:
+                if self._store is None:
+                    self._store = self.store_factory()
+        return self._store
+
+    def count(self, name, n=1):
+        with self.metrics_lock:
+            self.metrics[name] += n
+
+    def register(self, kind, handler):
+        '''Registers handler(job) to run jobs of the given kind.'''
+        self.handlers[kind] = handler
+
+    def start(self):
+        '''Starts the worker threads; jobs left queued or running by a previous process are picked up.'''
+        with self.start_lock:
+            if self.threads:
+                return
+            self.stopping = False
+            self.threads = [threading.Thread(target=self.run, name=f"job-worker-{i}", daemon=True)
+                            for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def enqueue(self, kind, payload, owner=None, key=None, job_id=None):
+        '''Durably queues a job and returns it.
+
+        Enqueueing again with the same idempotency key returns the existing job instead of adding one.
+        '''
+        job, created = self.store.add(job_id or uuid.uuid4().hex, kind, payload, owner, key)
+        if not created:
+            self.count("deduplicated")
+            return job
+
+        self.count("enqueued")
+        self.start()
+        with self.wakeup:
+            self.generation += 1
+            self.wakeup.notify()
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def run(self):
+        while not self.stopping:
+            generation = self.generation
+            try:
+                job = self.store.claim(self.lease)
+            except Exception:
+                traceback.print_exc()
+                job = None
+
+            if job:
+                self.execute(job)
+                continue
+
+            self.purge_if_due()
+            with self.wakeup:
+                if generation == self.generation and not self.stopping:
+                    self.wakeup.wait(self.poll_interval)
+
+    def execute(self, job):
+        '''Runs one claimed job and records its result, or schedules a retry if attempts remain.'''
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {job['kind']} jobs")
+            result = handler(job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if handler is None or job["attempts"] >= self.max_attempts:
+                print(f"Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {error}")
+                self.store.fail(job["id"], error)
+                self.count("failed")
+            else:
+                delay = retry_delay(job["attempts"])
+                print(f"Retrying job {job['id']} ({job['kind']}) after {error} in {delay:.1f}s")
+                self.store.retry(job["id"], error, delay)
+                self.count("retried")
+            return
+
+        self.store.complete(job["id"], result)
+        self.count("succeeded")
+
+    def purge_if_due(self):
+        now = time.time()
+        if now - self.last_purge < JOB_PURGE_INTERVAL:
+            return
+        self.last_purge = now
+        try:
+            self.count("purged", self.store.purge(now - self.retention))
+        except Exception:
+            traceback.print_exc()
+
+    def close(self):
+        '''Stops the workers after their current jobs; unfinished jobs stay queued for the next start.'''
+        self.stopping = True
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=self.poll_interval + 1)
+        self.threads = []
+
+    def stats(self):
+        '''Returns job counts by status and worker counters for monitoring.
+
+        The counts are zero until this process uses the queue, so monitoring never creates the job database
+        on hosts where the queue is off.
+        '''
+        counts = self._store.counts() if self._store is not None else {}
+        with self.metrics_lock:
+            metrics = dict(self.metrics)
+        return {**metrics, **{status: counts.get(status, 0) for status in ("queued", "running", *FINISHED)},
+                "workers": len(self.threads)}
+
+
+job_queue = JobQueue(lambda: job_store_from_url(JOB_QUEUE_URL))
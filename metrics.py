@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+# set METRICS_ENABLED=0 to turn every counter, histogram and stage timer into a no-op
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# set TRACE_REQUESTS=1 to print one JSON line per request with its stage timings and token usage
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "0") == "1"
+
+# seconds; spans a cached /clean hit up to a slow gpt-4 evaluation or a full CSV export
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metrics = []
+_stats_sources = []
+_current_trace = contextvars.ContextVar("trace", default=None)
+_disabled = nullcontext()
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    '''Monotonic counter with optional labels, rendered in the Prometheus text format.'''
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in sorted(values.items())]
+
+
+class Histogram:
+    '''Latency histogram with optional labels; buckets are rendered cumulatively as Prometheus expects.'''
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        with self.lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("pitch_stage_seconds", "Time spent in each request stage.", ("stage",))
+STAGE_ERRORS = Counter("pitch_stage_errors_total", "Stages that raised an exception.", ("stage",))
+REQUEST_SECONDS = Histogram("pitch_http_request_seconds", "Time to fully serve a request, including streamed bodies.",
+                            ("endpoint", "method", "status"))
+OPENAI_SECONDS = Histogram("pitch_openai_request_seconds", "OpenAI call latency, including scheduler waits and retries.",
+                           ("model",))
+OPENAI_ERRORS = Counter("pitch_openai_errors_total", "OpenAI calls that failed after retries.", ("model",))
+OPENAI_FALLBACKS = Counter("pitch_openai_fallbacks_total", "Calls answered by a fallback model.", ("model", "fallback"))
+OPENAI_TOKENS = Counter("pitch_openai_tokens_total", "Tokens reported by OpenAI responses.", ("model", "kind"))
+
+
+class Trace:
+    '''Stage timings and token usage collected for one request.'''
+
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages = []
+        self.tokens = {}
+
+    def emit(self, status):
+        print(json.dumps({
+            "trace": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": self.stages,
+            "tokens": self.tokens,
+        }), flush=True)
+
+
+@contextmanager
+def _timed(histogram, errors, trace_name, **labels):
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        errors.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append({"stage": trace_name, "ms": round(elapsed * 1000, 1), **({"error": error} if error else {})})
+
+
+def stage(name):
+    '''Context manager timing one stage of request handling (classification, evaluation, ...).'''
+    if not ENABLED:
+        return _disabled
+    return _timed(STAGE_SECONDS, STAGE_ERRORS, name, stage=name)
+
+
+def openai_call(model):
+    '''Context manager timing one OpenAI call and counting it as an error if it raises.'''
+    if not ENABLED:
+        return _disabled
+    return _timed(OPENAI_SECONDS, OPENAI_ERRORS, f"openai:{model}", model=model)
+
+
+def record_usage(model, usage):
+    '''Counts the prompt and completion tokens of an OpenAI response (its `usage` object, if any).'''
+    if not ENABLED or usage is None:
+        return
+    prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+    OPENAI_TOKENS.inc(prompt, model=model, kind="prompt")
+    OPENAI_TOKENS.inc(completion, model=model, kind="completion")
+
+    trace = _current_trace.get()
+    if trace is not None:
+        tokens = trace.tokens.setdefault(model, {"prompt": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
+
+
+def bind(fn):
+    '''Wraps fn so it runs in a copy of the caller's context, carrying the request trace into pool threads.'''
+    if not TRACE_REQUESTS:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def register_stats(component, source):
+    '''Exposes a component's stats() dict as gauges named pitch_<component>_<key>.
+
+    Nested dicts (e.g. per-model scheduler stats) become a "key" label; non-numeric values are skipped.
+    '''
+    _stats_sources.append((component, source))
+
+
+def render_stats():
+    lines = []
+    for component, source in _stats_sources:
+        try:
+            stats = source()
+        except Exception as e:
+            print(f"Error collecting {component} stats: {e}")
+            continue
+
+        series = {}
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                for stat, inner in value.items():
+                    series.setdefault(stat, []).append((format_labels(("key",), (key,)), inner))
+            else:
+                series.setdefault(key, []).append(("", value))
+
+        for stat, samples in series.items():
+            samples = [(labels, value) for labels, value in samples
+                       if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if samples:
+                name = f"pitch_{component}_{stat}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+    return lines
+
+
+def render():
+    '''Renders every metric and registered stats source in the Prometheus text exposition format.'''
+    lines = []
+    for metric in _metrics:
+        samples = metric.render()
+        if samples:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+    lines.extend(render_stats())
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    '''Times every request (streamed bodies included) and, with TRACE_REQUESTS=1, prints a trace per request.'''
+    if not ENABLED and not TRACE_REQUESTS:
+        return
+    from flask import request
+
+    @app.before_request
+    def start_request():
+        request.environ["metrics.started"] = time.perf_counter()
+        if TRACE_REQUESTS:
+            _current_trace.set(Trace(request.method, request.path))
+
+    @app.after_request
+    def finish_request(response):
+        started = request.environ.get("metrics.started", time.perf_counter())
+        labels = {"endpoint": request.endpoint or "unknown", "method": request.method, "status": str(response.status_code)}
+        trace = _current_trace.get()
+
+        def closed():
+            REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+            if trace is not None:
+                trace.emit(response.status_code)
+
+        # runs once a streamed body is fully sent, so SSE and CSV responses are timed end to end
+        response.call_on_close(closed)
+        return response
@@ -1,213 +1,76 @@
-import os
 import json
-import yaml
+import queue
 from dotenv import load_dotenv
-from openai import OpenAI
-from functools import lru_cache
+from scheduler import scheduler
+from classifier import local_classifier, log_classification
+import services
+from feedback_parser import evaluation_tool
+from metrics import openai_call, record_usage, OPENAI_FALLBACKS
+from resilience import timeout_for, fallback_chain
 
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
 
-if not api_key:
-    raise ValueError("API Key not found. Check your .env file.")
 
-client = OpenAI(api_key=api_key)
+def estimate_request_tokens(messages, max_tokens):
+    '''Estimates the tokens a chat request will consume, for the scheduler's per-minute budget.'''
+    return sum(estimate_tokens(m.get("content", "")) for m in messages) + max_tokens
 
 
-@lru_cache(maxsize=8)
-def load_yaml_cached(path):
-    '''Loads and caches YAML files'''
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read()
-        if not content.endswith("\n"):
-            content += "\n"
-            with open(path, "w", encoding="utf-8") as f_out:
-                f_out.write(content)
-        return yaml.safe_load(content)
-    except Exception as e:
-        print(f"Warning: Could not load {path}: {e}")
-        return {}
-    
-
-def build_system_prompt():
-    '''Builds an efficient, structured system prompt from pitch_assets.'''
-    framework = load_yaml_cached("pitch_assets/framework.yaml")
-    grading = load_yaml_cached("pitch_assets/grading.yaml")
-    examples = load_yaml_cached("pitch_assets/examples.yaml")
-
-    # framework overview
-    overview = framework.get("overview", {}).get("summary", "")
-
-    # principles
-    principles = framework.get("principles", [])
-    principles_str = "\n".join(f"- {p['name']}: {p['rule']}" for p in principles)
-
-    # components
-    components = framework.get("components", [])
-    components_str = "\n".join(
-        f"- {c['name']}: {c['goal']} (Must include: {c['must_include']})" for c in components
-    )
-
-    # grading criteria
-    criteria = grading.get("criteria", [])
-    criteria_str = "\n".join(
-        f"- {c['name']}: {c['signal']}\n  Example: {c['example']}" for c in criteria
-    )
-
-    # notes
-    notes = grading.get("notes", [])
-    notes_str = "\n".join(f"- {n}" for n in notes)
-
-    # examples
-    pitch_examples = examples.get("pitches", [])
-
-    def format_examples(examples, kind):
-        '''Helper function that formats examples for the system prompt.'''
-        if not examples:
-            return ""
-        
-        example_output = f"\n== {kind} Elevator Pitch Example(s) ==\n"
-
-        for ex in examples:
-            example_output += f"Title: {ex.get('title', '')}\n"
-            example_output += f"Audience: {ex.get('audience', '')}\n"
-            example_output += f"Word Count: {ex.get('word_count', '')}\n"
-            example_output += f"Reading Level: {ex.get('reading_level', '')}\n"
-            example_output += f"Pitch:\n{ex.get('content', '').strip()}\n"
-            eval_type = ex.get('evaluation', {}).get('type', '').lower()
-
-            if eval_type == "good":
-                strengths = ex.get('evaluation', {}).get('strengths', [])
-                if strengths:
-                    example_output += "Strengths: " + "; ".join(strengths) + "\n"
-                improvements = ex.get('evaluation', {}).get('improvements', [])
-                if improvements:
-                    example_output += "Possible Improvements: " + "; ".join(improvements) + "\n"
-
-            elif eval_type == "ok":
-                strengths = ex.get('evaluation', {}).get('strengths', [])
-                if strengths:
-                    example_output += "Strengths: " + "; ".join(strengths) + "\n"
-                weaknesses = ex.get('evaluation', {}).get('weaknesses', [])
-                if weaknesses:
-                    example_output += "Weaknesses: " + "; ".join(weaknesses) + "\n"
-                improvements = ex.get('evaluation', {}).get('improvements', [])
-                if improvements:
-                    example_output += "Suggested Improvements: " + "; ".join(improvements) + "\n"
-
-            elif eval_type == "bad":
-                weaknesses = ex.get('evaluation', {}).get('weaknesses', [])
-                if weaknesses:
-                    example_output += "Weaknesses: " + "; ".join(weaknesses) + "\n"
-                improvements = ex.get('evaluation', {}).get('improvements', [])
-                if improvements:
-                    example_output += "How to Improve: " + "; ".join(improvements) + "\n"
-            example_output += "\n"
-
-        return example_output
+def completion_call(kwargs):
+    '''The OpenAI request for a scheduler slot, bounded by the model's timeout (see resilience.py).'''
+    return lambda: services.get("openai").chat.completions.create(**kwargs, timeout=timeout_for(kwargs["model"]))
 
-    good_examples = [ex for ex in pitch_examples if ex.get("evaluation", {}).get("type", "").lower() == "good"]
-    ok_examples = [ex for ex in pitch_examples if ex.get("evaluation", {}).get("type", "").lower() == "ok"]
-    bad_examples = [ex for ex in pitch_examples if ex.get("evaluation", {}).get("type", "").lower() == "bad"]
 
-    prompt = f"""
-    You are an AI trained to strictly evaluate elevator pitches using the Priority Pitch methodology.
-    You have access to the full Priority Pitch framework, grading criteria, and canonical examples of good and bad pitches. Use all of these resources to inform your evaluation.
+def create_completion(**kwargs):
+    '''Creates a chat completion through the scheduler, blocking the calling thread until it finishes.'''
+    estimated = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+    with openai_call(kwargs["model"]):
+        response = scheduler.run(kwargs["model"], estimated, completion_call(kwargs), hedge=True)
+    record_usage(kwargs["model"], getattr(response, "usage", None))
+    return response
 
-    == Framework Overview ==
-    {overview}
 
-    == Principles ==
-    {principles_str}
+def create_completion_with_fallback(**kwargs):
+    '''Runs create_completion() down the model's fallback chain until a model answers.
 
-    == Required Components ==
-    {components_str}
-
-    == Grading Criteria ==
-    {criteria_str}
-
-    == Grading Notes ==
-    {notes_str}
-
-    == Examples ==
-    {format_examples(good_examples, 'Good')}{format_examples(ok_examples, 'OK')}{format_examples(bad_examples, 'Bad')}
-
-    == OUTPUT FORMAT ==
-    When evaluating an elevator pitch, respond strictly in the following format:
-
-    Pain [text]
-    Threat [text]
-    Belief Statement: [text]
-    Relief [text]
-    Tone [text]
-    Length [text]
-    Clarity [text]
-
-    If a section does not apply or is not present, use "N/A" and explain what the user should have included.
-
-    Your only job is to evaluate elevator pitches according to the above criteria and examples. Do not provide writing advice or revisions.
-    """
-
-    return prompt
-
-
-def build_fallback_system_prompt():
-    return """
-    You are a friendly conversational assistant.
-
-    Your primary role is to collect elevator pitches from users. You do not help write, craft, edit, or improve pitches, and you do not provide feedback or suggestions.
-
-    == Behavior Guidelines ==
-    - You are allowed to answer general questions, small talk, fun facts, math problems, or casual conversation.
-    - Whenever answering a general question, always remind the user that your main role is to collect their elevator pitch.
-
-    - If a user shares their pitch, reply with a simple acknowledgment like: 
-    "Thank you for sharing your pitch!"
-
-    - If a user asks for help writing, crafting, revising, or improving their pitch, politely decline:
-    "I'm not able to help with that. My job is only to collect pitches."
+    Returns (response, model that answered). Raises the last model's error if every model failed.
+    '''
+    error = None
+    for model in fallback_chain(kwargs["model"]):
+        try:
+            response = create_completion(**{**kwargs, "model": model})
+        except Exception as e:
+            print(f"Error fetching completion from {model}: {e}")
+            error = e
+            continue
 
-    - Do NOT explain that an evaluation happens behind the scenes.
+        if model != kwargs["model"]:
+            OPENAI_FALLBACKS.inc(model=kwargs["model"], fallback=model)
+        return response, model
+    raise error
 
-    == Examples ==
-    User: What's 2 + 2?
-    Assistant: 2 + 2 is 4. By the way, if you have an elevator pitch you'd like to share, I'm happy to hear it!
 
-    User: Who won the World Series in 2023?
-    Assistant: The Texas Rangers won the 2023 World Series! And if you have an elevator pitch, feel free to share it with me.
+def structured_request(sections):
+    '''Request options that make the model answer through the record_evaluation function.'''
+    return {
+        "tools": [evaluation_tool(sections)],
+        "tool_choice": {"type": "function", "function": {"name": "record_evaluation"}},
+    }
 
-    User: Can you help me write my pitch?
-    Assistant: I'm not able to help with that. My job is only to collect pitches.
 
-    User: What do you do?
-    Assistant: I can chat with you and answer questions, but my main job is to collect elevator pitches. If you have one ready, feel free to share it!
+def response_text(response):
+    '''The reply text of a completion: the function arguments if the model called one, else the message content.'''
+    message = response.choices[0].message
+    if getattr(message, "tool_calls", None):
+        return message.tool_calls[0].function.arguments
+    return message.content
 
-    == Important Rules ==
-    - Never offer to help improve, revise, or write a pitch.
-    - Always bring the conversation back to inviting the user to share their pitch.
-    """
 
+def classify_with_llm(user_input):
+    '''Makes a call to OpenAI's GPT model to classify input the local classifier couldn't decide.
 
-def is_valid_pitch(user_input):
-    '''
-    Classifies user input as either a pitch or non-pitch, with inline placeholder detection.
-    Makes a call to OpenAI's GPT model to classify the input.
+    If every model in the fallback chain fails, the local model's best guess is used instead.
     '''
-    placeholders = ["here is my pitch", "my pitch is", "test", "sample", "coming soon", "tbd", "to be added", "n/a", "na", "none", "placeholder", "draft", "lorem ipsum", "write my pitch", "i will write my pitch", "this is my pitch", "pitch", "elevator pitch", "submit", "hello", "hi", "-", "...", "?", "!", "[your pitch here]", "[insert pitch]"]
-
-    normalized = user_input.strip().lower()
-
-    if normalized in placeholders:
-        return {"is_pitch": False, "reason": "Placeholder"}
-    
-    for ph in placeholders:
-        if normalized.startswith(ph) or normalized.endswith(ph):
-            return {"is_pitch": False, "reason": "Placeholder"}
-        
-    if len(normalized) < 15:
-        return {"is_pitch": False, "reason": "Placeholder"}
-    
     classification_prompt = [
         {
             "role": "system",
@@ -226,23 +89,24 @@ def is_valid_pitch(user_input):
     ]
 
     try:
-        response = client.chat.completions.create(
+        response, _ = create_completion_with_fallback(
             model="gpt-3.5-turbo-0125",
             messages=classification_prompt,
             temperature=0,
             max_tokens=50,
         )
         result = json.loads(response.choices[0].message.content.strip())
+        log_classification(user_input, result.get("is_pitch", False))
         return result
     except Exception as e:
         print("Error during input classification:", e)
-        return {"is_pitch": True, "reason": "Fallback"}
+        return local_classifier.guess(user_input)
     
 
 def get_completion_from_messages(messages, model="gpt-4", temperature=0.4, max_tokens=500):
-    '''Sends a prompt and message history to OpenAI's GPT model to get a generated completion.'''
+    '''Sends a prompt and message history to OpenAI's GPT model (or its fallbacks) to get a generated completion.'''
     try:
-        response = client.chat.completions.create(
+        response, _ = create_completion_with_fallback(
             model=model,
             messages=messages,
             temperature=temperature,
@@ -252,38 +116,106 @@ def get_completion_from_messages(messages, model="gpt-4", temperature=0.4, max_t
     except Exception as e:
         print(f"Error fetching completion: {e}")
         return None
-    
 
-@lru_cache(maxsize=1)
-def get_cached_system_prompt():
-    return build_system_prompt()
 
+def stream_completion_from_messages(messages, model="gpt-3.5-turbo-0125", temperature=0.6, max_tokens=400):
+    '''Streams a completion from OpenAI (or its fallbacks), yielding text chunks as they arrive.
+
+    Moves to the next model in the fallback chain if a model fails, or has its circuit open, before the
+    first chunk; raises the last model's error if every model failed.
+    '''
+    error = None
+    for candidate in fallback_chain(model):
+        try:
+            yield from stream_from_model(messages, candidate, temperature, max_tokens)
+        except Exception as e:
+            print(f"Error streaming completion from {candidate}: {e}")
+            error = e
+            continue
+
+        if candidate != model:
+            OPENAI_FALLBACKS.inc(model=model, fallback=candidate)
+        return
+    raise error
+
+
+def stream_from_model(messages, model, temperature, max_tokens):
+    '''Streams a completion from one model through the scheduler, yielding text chunks as they arrive.
+
+    The request holds its scheduler slot until the stream ends. It is retried only if it fails before
+    the first chunk; a failure mid-stream just ends the stream early. Raises if the model produced nothing.
+    '''
+    chunks = queue.Queue()
+    done = object()
 
-@lru_cache(maxsize=1)
-def get_cached_fallback_system_prompt():
-    return build_fallback_system_prompt()
+    async def call():
+        stream = await services.get("openai").chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout_for(model)
+        )
+        try:
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    chunks.put(event.choices[0].delta.content)
+                if getattr(event, "usage", None):
+                    # sent in a final chunk with no choices
+                    record_usage(model, event.usage)
+        except Exception as e:
+            print(f"Error while streaming completion: {e}")
+
+    future = scheduler.schedule(model, estimate_request_tokens(messages, max_tokens), call)
+    future.add_done_callback(lambda _: chunks.put(done))
+
+    produced = False
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            produced = True
+            yield chunk
+    finally:
+        # the client went away or the consumer stopped early; stop reading from OpenAI too
+        future.cancel()
+
+    if not produced:
+        if not future.cancelled() and future.exception():
+            raise future.exception()
+        raise RuntimeError(f"{model} returned an empty reply")
+
+
+def estimate_tokens(text):
+    '''Roughly estimates the token count of text (about four characters per token).'''
+    return len(text) // 4 + 1
+
+
+def format_submission_for_summary(entry):
+    '''Formats one stored submission as a block of text for the summarization prompt.'''
+    fb = entry.get("feedback", {})
+    pitch = entry.get("pitch", "")
+    return (
+        f"Pitch: {pitch}\n"
+        f"Pain: {fb.get('Pain', '')}\n"
+        f"Threat: {fb.get('Threat', '')}\n"
+        f"Belief Statement: {fb.get('Belief Statement', '')}\n"
+        f"Relief: {fb.get('Relief', '')}\n"
+        f"Tone: {fb.get('Tone', '')}\n"
+        f"Length: {fb.get('Length', '')}\n"
+        f"Clarity: {fb.get('Clarity', '')}"
+    )
 
 
 def summarize_feedback(submissions):
     '''Summarizes common weaknesses across multiple pitch evaluations.'''
-    if not submissions:
-        return "No submissions available."
+    sections = [format_submission_for_summary(entry) for entry in submissions]
 
-    sections = []
-    for entry in submissions:
-        fb = entry.get("feedback", {})
-        pitch = entry.get("pitch", "")
-        text = (
-            f"Pitch: {pitch}\n"
-            f"Pain: {fb.get('Pain', '')}\n"
-            f"Threat: {fb.get('Threat', '')}\n"
-            f"Belief Statement: {fb.get('Belief Statement', '')}\n"
-            f"Relief: {fb.get('Relief', '')}\n"
-            f"Tone: {fb.get('Tone', '')}\n"
-            f"Length: {fb.get('Length', '')}\n"
-            f"Clarity: {fb.get('Clarity', '')}"
-        )
-        sections.append(text)
+    if not sections:
+        return "No submissions available."
 
     prompt = [
         {
@@ -300,4 +232,31 @@ def summarize_feedback(submissions):
     summary = get_completion_from_messages(
         prompt, model="gpt-3.5-turbo-0125", temperature=0.3, max_tokens=300
     )
-    return summary.strip() if summary else ""
\ No newline at end of file
+    return summary.strip() if summary else ""
+
+
+def merge_summaries(summaries):
+    '''Merges several partial weakness summaries into one combined summary.'''
+    summaries = [s for s in summaries if s]
+
+    if not summaries:
+        return ""
+    if len(summaries) == 1:
+        return summaries[0]
+
+    prompt = [
+        {
+            "role": "system",
+            "content": (
+                "You combine several summaries of elevator pitch weaknesses into one. "
+                "Merge overlapping points, keep the most common patterns first, and "
+                "respond with concise bullet points only."
+            ),
+        },
+        {"role": "user", "content": "\n\n---\n\n".join(summaries)},
+    ]
+
+    merged = get_completion_from_messages(
+        prompt, model="gpt-3.5-turbo-0125", temperature=0.3, max_tokens=300
+    )
+    return merged.strip() if merged else ""
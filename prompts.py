@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+
+ASSET_PATHS = [
+    "pitch_assets/framework.yaml",
+    "pitch_assets/grading.yaml",
+    "pitch_assets/examples.yaml",
+]
+ARTIFACT_PATH = "pitch_assets/compiled_prompts.json"
+
+# how often (in seconds) the asset files are checked for edits
+RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "5"))
+
+
+def load_yaml(path):
+    '''Loads a YAML file, returning an empty dict if it can't be read.'''
+    import yaml
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return {}
+
+
+# sections gpt-4 judges; Belief Statement, Tone, Length and Clarity are scored locally by text_metrics
+JUDGED_SECTIONS = ("Pain", "Threat", "Relief")
+
+# bump when the layout of the compiled prompts changes, so artifacts and evaluations from the old
+# layout stop counting as current
+PROMPT_LAYOUT = "2"
+
+
+def format_example(ex):
+    '''Formats one example pitch and its evaluation for the system prompt.'''
+    example_output = f"Title: {ex.get('title', '')}\n"
+    example_output += f"Audience: {ex.get('audience', '')}\n"
+    example_output += f"Word Count: {ex.get('word_count', '')}\n"
+    example_output += f"Reading Level: {ex.get('reading_level', '')}\n"
+    example_output += f"Pitch:\n{ex.get('content', '').strip()}\n"
+    eval_type = ex.get('evaluation', {}).get('type', '').lower()
+
+    if eval_type == "good":
+        strengths = ex.get('evaluation', {}).get('strengths', [])
+        if strengths:
+            example_output += "Strengths: " + "; ".join(strengths) + "\n"
+        improvements = ex.get('evaluation', {}).get('improvements', [])
+        if improvements:
+            example_output += "Possible Improvements: " + "; ".join(improvements) + "\n"
+
+    elif eval_type == "ok":
+        strengths = ex.get('evaluation', {}).get('strengths', [])
+        if strengths:
+            example_output += "Strengths: " + "; ".join(strengths) + "\n"
+        weaknesses = ex.get('evaluation', {}).get('weaknesses', [])
+        if weaknesses:
+            example_output += "Weaknesses: " + "; ".join(weaknesses) + "\n"
+        improvements = ex.get('evaluation', {}).get('improvements', [])
+        if improvements:
+            example_output += "Suggested Improvements: " + "; ".join(improvements) + "\n"
+
+    elif eval_type == "bad":
+        weaknesses = ex.get('evaluation', {}).get('weaknesses', [])
+        if weaknesses:
+            example_output += "Weaknesses: " + "; ".join(weaknesses) + "\n"
+        improvements = ex.get('evaluation', {}).get('improvements', [])
+        if improvements:
+            example_output += "How to Improve: " + "; ".join(improvements) + "\n"
+
+    return example_output + "\n"
+
+
+def format_examples(examples):
+    '''Formats the examples section of the system prompt, grouping good, then ok, then bad examples.'''
+    output = "\n    == Examples ==\n"
+    for grade, kind in (("good", "Good"), ("ok", "OK"), ("bad", "Bad")):
+        group = [ex for ex in examples if ex.get("evaluation", {}).get("type", "").lower() == grade]
+        if group:
+            output += f"\n== {kind} Elevator Pitch Example(s) ==\n" + "".join(format_example(ex) for ex in group)
+    return output
+
+
+def build_rubric_prompt(sections=JUDGED_SECTIONS):
+    '''Builds the part of the evaluation prompt that is the same for every pitch, asking only for the given sections.
+
+    It leads the prompt so OpenAI can cache it as a shared prefix; the examples picked for each pitch follow it.
+    '''
+    framework = load_yaml("pitch_assets/framework.yaml")
+    grading = load_yaml("pitch_assets/grading.yaml")
+
+    # framework overview
+    overview = framework.get("overview", {}).get("summary", "")
+
+    # principles
+    principles = framework.get("principles", [])
+    principles_str = "\n".join(f"- {p['name']}: {p['rule']}" for p in principles)
+
+    # components
+    components = [c for c in framework.get("components", []) if c.get("name") in sections]
+    components_str = "\n".join(
+        f"- {c['name']}: {c['goal']} (Must include: {c['must_include']})" for c in components
+    )
+
+    # grading criteria
+    criteria = [c for c in grading.get("criteria", []) if c.get("name") in sections]
+    criteria_str = "\n".join(
+        f"- {c['name']}: {c['signal']}\n  Example: {c['example']}" for c in criteria
+    )
+
+    # notes
+    notes = [n for n in grading.get("notes", []) if not n.startswith("All 7 elements")]
+    notes.append(f"Evaluate only these sections: {', '.join(sections)}. The others are scored separately.")
+    notes_str = "\n".join(f"- {n}" for n in notes)
+
+    output_format_str = "\n    ".join(f"{name} [text]" for name in sections)
+
+    prompt = f"""
+    You are an AI trained to strictly evaluate elevator pitches using the Priority Pitch methodology.
+    You have access to the full Priority Pitch framework, grading criteria, and canonical examples of good and bad pitches. Use all of these resources to inform your evaluation.
+
+    == Framework Overview ==
+    {overview}
+
+    == Principles ==
+    {principles_str}
+
+    == Required Components ==
+    {components_str}
+
+    == Grading Criteria ==
+    {criteria_str}
+
+    == Grading Notes ==
+    {notes_str}
+
+    == OUTPUT FORMAT ==
+    When evaluating an elevator pitch, respond strictly in the following format:
+
+    {output_format_str}
+
+    If a section does not apply or is not present, use "N/A" and explain what the user should have included.
+
+    Your only job is to evaluate elevator pitches according to these criteria and the examples below. Do not provide writing advice or revisions.
+    """
+
+    return prompt
+
+
+def build_system_prompt(sections=JUDGED_SECTIONS, examples=None):
+    '''Builds the full evaluation prompt with the given examples, or with every example in pitch_assets.'''
+    if examples is None:
+        examples = load_yaml("pitch_assets/examples.yaml").get("pitches", [])
+    return build_rubric_prompt(sections) + format_examples(examples)
+
+
+def build_fallback_system_prompt():
+    return """
+    You are a friendly conversational assistant.
+
+    Your primary role is to collect elevator pitches from users. You do not help write, craft, edit, or improve pitches, and you do not provide feedback or suggestions.
+
+    == Behavior Guidelines ==
+    - You are allowed to answer general questions, small talk, fun facts, math problems, or casual conversation.
+    - Whenever answering a general question, always remind the user that your main role is to collect their elevator pitch.
+
+    - If a user shares their pitch, reply with a simple acknowledgment like: 
+    "Thank you for sharing your pitch!"
+
+    - If a user asks for help writing, crafting, revising, or improving their pitch, politely decline:
+    "I'm not able to help with that. My job is only to collect pitches."
+
+    - Do NOT explain that an evaluation happens behind the scenes.
+
+    == Examples ==
+    User: What's 2 + 2?
+    Assistant: 2 + 2 is 4. By the way, if you have an elevator pitch you'd like to share, I'm happy to hear it!
+
+    User: Who won the World Series in 2023?
+    Assistant: The Texas Rangers won the 2023 World Series! And if you have an elevator pitch, feel free to share it with me.
+
+    User: Can you help me write my pitch?
+    Assistant: I'm not able to help with that. My job is only to collect pitches.
+
+    User: What do you do?
+    Assistant: I can chat with you and answer questions, but my main job is to collect elevator pitches. If you have one ready, feel free to share it!
+
+    == Important Rules ==
+    - Never offer to help improve, revise, or write a pitch.
+    - Always bring the conversation back to inviting the user to share their pitch.
+    """
+
+
+def assets_version(paths=ASSET_PATHS):
+    '''Hashes the pitch asset files; any edit to them produces a new prompt version.'''
+    digest = hashlib.sha256(PROMPT_LAYOUT.encode("utf-8"))
+    for path in paths:
+        digest.update(path.encode("utf-8"))
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"missing")
+    return digest.hexdigest()[:12]
+
+
+def compile_prompts(version=None):
+    '''Builds every system prompt from pitch_assets, tagged with the version of the assets used.
+
+    Besides the full evaluation prompt, the artifact holds its static rubric and the raw examples,
+    from which system_prompt_for() assembles a shorter prompt per pitch.
+    '''
+    examples = load_yaml("pitch_assets/examples.yaml").get("pitches", [])
+    rubric_prompt = build_rubric_prompt()
+    return {
+        "version": version or assets_version(),
+        "system_prompt": rubric_prompt + format_examples(examples),
+        "rubric_prompt": rubric_prompt,
+        "examples": examples,
+        "fallback_system_prompt": build_fallback_system_prompt(),
+    }
+
+
+def write_artifact(path=ARTIFACT_PATH):
+    '''Compiles the prompts and writes them to the artifact file loaded at runtime.'''
+    compiled = compile_prompts()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(compiled, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    return compiled
+
+
+def load_artifact(path=ARTIFACT_PATH):
+    '''Loads the compiled prompt artifact, or None if it is missing or unreadable.'''
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class PromptStore:
+    '''Lazily loads the compiled prompts and rebuilds them in memory when the asset files change.'''
+
+    def __init__(self, artifact_path=ARTIFACT_PATH, asset_paths=ASSET_PATHS, reload_interval=RELOAD_INTERVAL):
+        self.artifact_path = artifact_path
+        self.asset_paths = asset_paths
+        self.reload_interval = reload_interval
+        self.prompts = None
+        self.mtimes = None
+        self.checked_at = 0.0
+        self.example_index = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        '''Returns the current prompts dict (version, system_prompt, rubric_prompt, examples, fallback_system_prompt).'''
+        if self.prompts is None or time.monotonic() - self.checked_at >= self.reload_interval:
+            with self.lock:
+                self.refresh()
+        return self.prompts
+
+    def refresh(self):
+        self.checked_at = time.monotonic()
+        mtimes = tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in self.asset_paths)
+        if self.prompts is not None and mtimes == self.mtimes:
+            return
+
+        version = assets_version(self.asset_paths)
+        if self.prompts is None or self.prompts["version"] != version:
+            artifact = load_artifact(self.artifact_path)
+            if artifact and artifact.get("version") == version:
+                self.prompts = artifact
+            else:
+                if self.prompts is not None:
+                    print(f"Pitch assets changed, rebuilding prompts (version {version})")
+                self.prompts = compile_prompts(version)
+        self.mtimes = mtimes
+
+    def system_prompt(self):
+        return self.current()["system_prompt"]
+
+    def system_prompt_for(self, pitch, prompts=None):
+        '''Evaluation prompt for one pitch: the static rubric, then only the examples most relevant to it.
+
+        Pass the dict from current() to keep the prompt consistent with the version recorded for it.
+        With FEW_SHOT_K=0 every example is included, as in system_prompt().
+        '''
+        from few_shot import ExampleIndex, FEW_SHOT_K
+
+        prompts = prompts or self.current()
+        if FEW_SHOT_K <= 0:
+            return prompts["system_prompt"]
+
+        # rebuilt whenever the assets (and so the examples) change
+        version, index = self.example_index or (None, None)
+        if version != prompts["version"]:
+            index = ExampleIndex(prompts["examples"], format_example)
+            self.example_index = (prompts["version"], index)
+        return prompts["rubric_prompt"] + format_examples(index.select(pitch))
+
+    def fallback_system_prompt(self):
+        return self.current()["fallback_system_prompt"]
+
+    def version(self):
+        return self.current()["version"]
+
+
+prompt_store = PromptStore()
+
+
+if __name__ == "__main__":
+    # build step: python prompts.py [output path]
+    compiled = write_artifact(sys.argv[1] if len(sys.argv) > 1 else ARTIFACT_PATH)
+    print(f"Wrote prompt artifact version {compiled['version']}")
@@ -0,0 +1,165 @@
+import os
+import time
+import sqlite3
+import threading
+
+# "route:scope:requests/seconds,..." where scope is "user" (session email) or "domain" (email domain)
+DEFAULT_RATE_LIMITS = "chat:user:10/60,chat:domain:120/60,clean:user:30/60,clean:domain:300/60"
+
+# the in-memory store forgets idle buckets (which are full again anyway) once it holds this many
+MEMORY_STORE_SWEEP_SIZE = 10000
+
+
+def parse_rate_limits(spec):
+    '''Parses "route:scope:requests/seconds,..." into {route: [(scope, refill per second, burst)]}.'''
+    limits = {}
+    for item in spec.split(","):
+        parts = item.strip().split(":")
+        if len(parts) != 3 or "/" not in parts[2]:
+            continue
+        route, scope, rate = parts
+        requests, seconds = rate.split("/")
+        limits.setdefault(route, []).append((scope, int(requests) / float(seconds), int(requests)))
+    return limits
+
+
+class MemoryBucketStore:
+    '''Token buckets held in this process; each worker process enforces its own limits.'''
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        '''Takes cost tokens from the bucket. Returns 0 if allowed, else seconds until enough tokens refill.'''
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now, rate, capacity))[:2]
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now, rate, capacity)
+
+            if len(self.buckets) > MEMORY_STORE_SWEEP_SIZE:
+                self.buckets = {k: b for k, b in self.buckets.items() if b[0] + (now - b[1]) * b[2] < b[3]}
+        return 0 if allowed else (cost - tokens) / rate
+
+
+class SQLiteBucketStore:
+    '''Token buckets in a local SQLite file, shared by every worker process on the host.'''
+
+    # buckets untouched this long are full again and can be dropped
+    IDLE_SECONDS = 3600
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.takes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.time()
+        with self.lock:
+            # an immediate transaction serializes the read-modify-write across processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self.conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                                  (key, tokens, now))
+                self.takes += 1
+                if self.takes % 1000 == 0:
+                    self.conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.IDLE_SECONDS,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return 0 if allowed else (cost - tokens) / rate
+
+
+class RedisBucketStore:
+    '''Token buckets in Redis, shared across hosts. Requires the redis package.'''
+
+    # refill and take atomically on the server, using the server clock
+    SCRIPT = """
+    local rate, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+
+        client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.script = client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, capacity, cost=1):
+        return float(self.script(keys=[self.prefix + key], args=[rate, capacity, cost]))
+
+
+def store_from_url(url):
+    '''Builds a bucket store from "sqlite:///path/to/file.db" or "redis://host:port/db"; in-memory if unset.'''
+    if not url:
+        return MemoryBucketStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteBucketStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBucketStore(url)
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+class RateLimiter:
+    '''Token-bucket limits per route, applied to the caller's email and to their whole email domain.'''
+
+    def __init__(self, limits, store):
+        self.limits = limits
+        self.store = store
+        self.lock = threading.Lock()
+        self.counts = {"allowed": 0, "limited": 0, "store_errors": 0}
+
+    def check(self, route, identity, domain=None):
+        '''Takes a token from every bucket that applies. Returns 0 if allowed, else the seconds to wait.
+
+        A request refused by one bucket still spends its tokens in the others, which only makes
+        limits slightly stricter under sustained abuse.
+        '''
+        wait = 0
+        for scope, rate, burst in self.limits.get(route, []):
+            subject = identity if scope == "user" else domain
+            if not subject:
+                continue
+            try:
+                wait = max(wait, self.store.take(f"{route}:{scope}:{subject}", rate, burst))
+            except Exception as e:
+                # fail open: an unavailable shared store shouldn't take the app down
+                print(f"Error checking rate limit: {e}")
+                with self.lock:
+                    self.counts["store_errors"] += 1
+
+        with self.lock:
+            self.counts["limited" if wait else "allowed"] += 1
+        return wait
+
+    def stats(self):
+        return dict(self.counts)
+
+
+rate_limiter = RateLimiter(
+    parse_rate_limits(os.getenv("RATE_LIMITS", DEFAULT_RATE_LIMITS)),
+    store_from_url(os.getenv("RATE_LIMIT_BACKEND", "")),
+)
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from collections import deque
+
+# per-attempt request timeouts in seconds, "model:seconds,..."; unlisted models use MODEL_TIMEOUT
+DEFAULT_TIMEOUT = float(os.getenv("MODEL_TIMEOUT", "60"))
+DEFAULT_MODEL_TIMEOUTS = "gpt-4:45,gpt-4o-mini:20,gpt-3.5-turbo-0125:15"
+
+# deadline in seconds for one call to a model, covering queueing, retries, hedges and backoff; once it
+# passes, the caller moves on to the model's fallback. "model:seconds,..."; unlisted models use MODEL_DEADLINE
+DEFAULT_DEADLINE = float(os.getenv("MODEL_DEADLINE", "90"))
+DEFAULT_MODEL_DEADLINES = "gpt-4:60,gpt-4o-mini:30,gpt-3.5-turbo-0125:20"
+
+# ordered fallback models tried when a model fails or its circuit is open, "model>fallback>...,..."
+DEFAULT_MODEL_FALLBACKS = "gpt-4>gpt-4o-mini,gpt-3.5-turbo-0125>gpt-4o-mini"
+
+# a model's circuit opens when at least BREAKER_MIN_CALLS attempts in the last BREAKER_WINDOW seconds
+# failed at a rate of BREAKER_ERROR_RATE or more; it stays open for BREAKER_COOLDOWN seconds
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+# it also opens after this many timeouts in a row: with timeouts of tens of seconds a hung model
+# never produces BREAKER_MIN_CALLS outcomes within the window
+BREAKER_MAX_TIMEOUTS = int(os.getenv("BREAKER_MAX_TIMEOUTS", "3"))
+
+# a duplicate request is sent once a call outlasts this percentile of the model's recent latencies
+# (0 disables hedging); hedges are capped at HEDGE_MAX_RATIO of the model's calls
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = 50
+LATENCY_SAMPLES = 500
+
+
+def parse_model_timeouts(spec):
+    '''Parses "model:seconds,..." into {model: seconds}.'''
+    timeouts = {}
+    for item in spec.split(","):
+        name, _, seconds = item.strip().rpartition(":")
+        if name and seconds:
+            timeouts[name] = float(seconds)
+    return timeouts
+
+
+def parse_model_fallbacks(spec):
+    '''Parses "model>fallback>...,..." into {model: [fallback, ...]}.'''
+    chains = {}
+    for item in spec.split(","):
+        models = [m.strip() for m in item.split(">") if m.strip()]
+        if len(models) > 1:
+            chains[models[0]] = models[1:]
+    return chains
+
+
+MODEL_TIMEOUTS = parse_model_timeouts(os.getenv("MODEL_TIMEOUTS", DEFAULT_MODEL_TIMEOUTS))
+MODEL_FALLBACKS = parse_model_fallbacks(os.getenv("MODEL_FALLBACKS", DEFAULT_MODEL_FALLBACKS))
+MODEL_DEADLINES = parse_model_timeouts(os.getenv("MODEL_DEADLINES", DEFAULT_MODEL_DEADLINES))
+
+
+def timeout_for(model):
+    return MODEL_TIMEOUTS.get(model, DEFAULT_TIMEOUT)
+
+
+def deadline_for(model):
+    return MODEL_DEADLINES.get(model, DEFAULT_DEADLINE)
+
+
+def fallback_chain(model):
+    '''The model followed by its fallbacks, in the order they should be tried.'''
+    return [model] + MODEL_FALLBACKS.get(model, [])
+
+
+class CircuitOpenError(Exception):
+    '''Raised instead of calling a model whose circuit breaker is open.'''
+
+
+class ModelDeadlineError(Exception):
+    '''Raised when a model call, with its retries and hedges, doesn't finish before its deadline.'''
+
+
+class CircuitBreaker:
+    '''Stops sending requests to a model for a cooldown once its recent error rate spikes.
+
+    Timeouts also open it once BREAKER_MAX_TIMEOUTS happen in a row without a success in between.
+    After the cooldown one probe request is let through: success closes the circuit, failure
+    reopens it for another cooldown.
+    '''
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, error_rate=BREAKER_ERROR_RATE,
+                 cooldown=BREAKER_COOLDOWN, max_timeouts=BREAKER_MAX_TIMEOUTS):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.max_timeouts = max_timeouts
+        self.timeouts_in_row = 0
+        self.outcomes = deque()
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        '''True if a request may be sent now.'''
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "closed" or (self.state == "half_open" and not self.probing):
+                self.probing = self.state == "half_open"
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, timed_out=False):
+        '''Records an attempt's outcome; None (e.g. a cancelled hedge) only frees the half-open probe.'''
+        now = time.monotonic()
+        with self.lock:
+            if ok:
+                self.timeouts_in_row = 0
+            elif timed_out:
+                self.timeouts_in_row += 1
+            if self.state == "half_open":
+                self.probing = False
+                if ok:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                elif ok is not None:
+                    self.trip(now)
+                return
+            if ok is None or self.state == "open":
+                return
+            if self.timeouts_in_row >= self.max_timeouts:
+                self.trip(now)
+                return
+
+            self.outcomes.append((now, ok))
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                self.outcomes.popleft()
+
+            failures = sum(1 for _, succeeded in self.outcomes if not succeeded)
+            if len(self.outcomes) >= self.min_calls and failures >= self.error_rate * len(self.outcomes):
+                self.trip(now)
+
+    def trip(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        self.outcomes.clear()
+        self.timeouts_in_row = 0
+
+    def stats(self):
+        with self.lock:
+            return {"circuit_open": int(self.state != "closed"), "circuit_trips": self.trips,
+                    "circuit_rejected": self.rejected}
+
+
+class LatencyTracker:
+    '''Latencies of a model's recent successful calls, used to pick when to hedge.'''
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        '''The pct-th percentile in seconds, or None until there are enough samples to trust it.'''
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
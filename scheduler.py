@@ -0,0 +1,260 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from resilience import (CircuitBreaker, CircuitOpenError, ModelDeadlineError, LatencyTracker, deadline_for,
+                        HEDGE_PERCENTILE, HEDGE_MAX_RATIO)
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("MODEL_TOKENS_PER_MINUTE", "0"))
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+BASE_RETRY_DELAY = float(os.getenv("MODEL_RETRY_DELAY", "0.5"))
+MAX_RETRY_DELAY = float(os.getenv("MODEL_MAX_RETRY_DELAY", "20"))
+
+
+def parse_model_limits(spec):
+    '''Parses "model:max_concurrency:tokens_per_minute,..." into {model: (concurrency, tpm)}.'''
+    limits = {}
+    for item in spec.split(","):
+        parts = item.strip().split(":")
+        if len(parts) != 3:
+            continue
+        name, concurrency, tpm = parts
+        limits[name] = (int(concurrency), int(tpm))
+    return limits
+
+
+class TokenBudget:
+    '''A tokens-per-minute budget that refills continuously. A limit of 0 means unlimited.'''
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        '''Waits until tokens are available. The lock hands out budget to waiters in arrival order.'''
+        if not self.capacity:
+            return
+        tokens = min(tokens, self.capacity)
+
+        async with self.lock:
+            self.refill()
+            while self.available < tokens:
+                await asyncio.sleep((tokens - self.available) * 60 / self.capacity)
+                self.refill()
+            self.available -= tokens
+
+    def adjust(self, tokens):
+        '''Corrects the budget once actual usage is known (positive refunds, negative charges).'''
+        if self.capacity:
+            self.available = min(self.capacity, self.available + tokens)
+
+
+class ModelLimiter:
+    '''Concurrency slots, token budget, circuit breaker and latency history for one model.'''
+
+    def __init__(self, max_concurrency, tokens_per_minute):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.budget = TokenBudget(tokens_per_minute)
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.waiting = 0
+        self.active = 0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+
+class RequestScheduler:
+    '''Runs OpenAI calls on a dedicated event loop with per-model concurrency, token budgets, retries,
+    circuit breakers and hedged requests.
+
+    Synchronous callers (Flask views) use run(); coroutines already on the scheduler loop can
+    await submit() directly.
+    '''
+
+    def __init__(self, model_limits=None):
+        self.model_limits = model_limits or {}
+        self.limiters = {}
+        self.loop = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        '''Starts the background event loop thread on first use.'''
+        with self.start_lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="model-scheduler", daemon=True).start()
+                self.loop = loop
+        return self.loop
+
+    def limiter(self, model):
+        if model not in self.limiters:
+            concurrency, tpm = self.model_limits.get(model, (DEFAULT_MAX_CONCURRENCY, DEFAULT_TOKENS_PER_MINUTE))
+            self.limiters[model] = ModelLimiter(concurrency, tpm)
+        return self.limiters[model]
+
+    async def submit(self, model, estimated_tokens, call, deadline=None):
+        '''Runs call() (a coroutine function) under the model's limits, retrying 429/5xx with jittered backoff.
+
+        deadline (a time.monotonic() value, by default deadline_for(model) from now) bounds the queueing,
+        every attempt and the backoff between them. A timed-out attempt isn't retried on the same model:
+        the error goes straight back so the caller can try the next model in its fallback chain.
+        Raises CircuitOpenError without calling the model if its circuit breaker is open, and
+        ModelDeadlineError once the deadline passes.
+        '''
+        limiter = self.limiter(model)
+        if deadline is None:
+            deadline = time.monotonic() + deadline_for(model)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if not limiter.breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker open for {model}")
+
+            limiter.waiting += 1
+            try:
+                await before_deadline(limiter.semaphore.acquire(), deadline, model)
+            finally:
+                limiter.waiting -= 1
+
+            limiter.active += 1
+            error = None
+            # None if cancelled (e.g. the losing half of a hedge) or still queued for the token budget,
+            # which says nothing about the model's health
+            ok = None
+            calling = False
+            try:
+                await before_deadline(limiter.budget.acquire(estimated_tokens), deadline, model)
+                calling = True
+                started = time.monotonic()
+                result = await before_deadline(call(), deadline, model)
+                limiter.latency.add(time.monotonic() - started)
+                ok = True
+            except timeout_errors() as e:
+                error = e
+                ok = False if calling else None
+            except retryable_errors() as e:
+                error = e
+                ok = False
+            except Exception:
+                # the API answered, the request itself was rejected (e.g. a 400)
+                ok = True
+                raise
+            finally:
+                limiter.breaker.record(ok, timed_out=calling and isinstance(error, timeout_errors()))
+                limiter.active -= 1
+                limiter.semaphore.release()
+
+            if error is None:
+                usage = getattr(result, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    limiter.budget.adjust(estimated_tokens - usage.total_tokens)
+                return result
+
+            delay = retry_delay(attempt, error)
+            if (attempt == MAX_RETRIES or isinstance(error, timeout_errors())
+                    or time.monotonic() + delay >= deadline):
+                raise error
+            print(f"Retrying {model} after {type(error).__name__} in {delay:.2f}s")
+            # back off outside the semaphore so queued requests can use the slot
+            await asyncio.sleep(delay)
+
+    async def submit_hedged(self, model, estimated_tokens, call, deadline=None):
+        '''submit(), plus one duplicate request if the first is still running after the model's hedge delay.
+
+        The first to succeed wins and the other is cancelled; both share the one deadline. There's no hedging until the model has
+        enough latency samples, while its requests are queueing, or beyond HEDGE_MAX_RATIO of its calls.
+        '''
+        limiter = self.limiter(model)
+        limiter.calls += 1
+        if deadline is None:
+            deadline = time.monotonic() + deadline_for(model)
+        tasks = [asyncio.ensure_future(self.submit(model, estimated_tokens, call, deadline))]
+
+        try:
+            delay = limiter.latency.percentile(HEDGE_PERCENTILE) if HEDGE_PERCENTILE else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not limiter.waiting and limiter.hedged < HEDGE_MAX_RATIO * limiter.calls:
+                    limiter.hedged += 1
+                    tasks.append(asyncio.ensure_future(self.submit(model, estimated_tokens, call, deadline)))
+
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        limiter.hedge_wins += task is not tasks[0]
+                        return task.result()
+                if not pending:
+                    # every attempt failed; raise the first request's error
+                    return tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def schedule(self, model, estimated_tokens, call, hedge=False):
+        '''Submits a call from any thread and returns a concurrent.futures.Future for its result.
+
+        The model's deadline starts now, so time spent waiting for the scheduler loop counts against it.
+        '''
+        loop = self.start()
+        submit = self.submit_hedged if hedge else self.submit
+        deadline = time.monotonic() + deadline_for(model)
+        return asyncio.run_coroutine_threadsafe(submit(model, estimated_tokens, call, deadline), loop)
+
+    def run(self, model, estimated_tokens, call, timeout=None, hedge=False):
+        '''Blocks the calling thread until the scheduled call finishes and returns its result.'''
+        return self.schedule(model, estimated_tokens, call, hedge).result(timeout)
+
+    def stats(self):
+        '''Returns per-model queue depth, active calls, circuit breaker state and hedging counts.'''
+        return {
+            model: {"waiting": limiter.waiting, "active": limiter.active,
+                    "tokens_available": int(limiter.budget.available) if limiter.budget.capacity else None,
+                    **limiter.breaker.stats(), "hedged": limiter.hedged, "hedge_wins": limiter.hedge_wins}
+            for model, limiter in self.limiters.items()
+        }
+
+
+def retryable_errors():
+    '''Errors worth retrying on the same model: 429s, 5xx responses and dropped connections.'''
+    from openai import RateLimitError, InternalServerError, APIConnectionError
+    return (RateLimitError, InternalServerError, APIConnectionError)
+
+
+def timeout_errors():
+    '''Errors from a model that didn't answer in time. They count toward its circuit breaker but aren't retried.'''
+    from openai import APITimeoutError
+    return (APITimeoutError, ModelDeadlineError)
+
+
+async def before_deadline(awaitable, deadline, model):
+    '''Awaits awaitable, raising ModelDeadlineError if it hasn't finished by the deadline.'''
+    try:
+        return await asyncio.wait_for(awaitable, max(0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise ModelDeadlineError(f"{model} call ran past its {deadline_for(model):g}s deadline") from None
+
+
+def retry_delay(attempt, error):
+    '''Exponential backoff with full jitter, honoring a Retry-After header when the API sends one.'''
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
+
+
+scheduler = RequestScheduler(parse_model_limits(os.getenv("MODEL_LIMITS", "")))
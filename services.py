@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+
+# heavy SDKs (firebase_admin, openai, httpx) are only imported inside these factories, so importing
+# the app stays cheap and routes like /login never pay for them
+
+_factories = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name, factory):
+    '''Registers a zero-argument factory that builds a service on first use.'''
+    _factories[name] = factory
+
+
+def get(name):
+    '''Returns the named service, building it on first use.'''
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _factories[name]()
+                _instances[name] = instance
+    return instance
+
+
+def override(name, instance):
+    '''Replaces a service with a ready-made instance (e.g. an in-memory fake for benchmarks).'''
+    with _lock:
+        _instances[name] = instance
+
+
+def is_loaded(name):
+    '''True if the named service has already been built.'''
+    return name in _instances
+
+
+def create_firestore_client():
+    '''Initializes Firebase from the environment or the local credentials file and returns a Firestore client.
+
+    When FIRESTORE_EMULATOR_HOST is set, connects to the local emulator instead.
+    '''
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        # the emulator needs no credentials; the client picks up the host from the environment
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.Client(project=os.getenv("FIREBASE_PROJECT_ID", "demo-priority-pitch"))
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        firebase_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
+
+        if firebase_json:
+            print("Using Firebase credentials from environment variable")
+
+            parsed_json = json.loads(firebase_json)
+
+            cred = credentials.Certificate(parsed_json)
+        else:
+            print("Using local Firebase credentials file")
+            cred = credentials.Certificate("credentials/firebase-adminsdk.json")
+
+        firebase_admin.initialize_app(cred)
+
+    return firestore.client()
+
+
+def create_openai_client():
+    '''Builds the pooled async OpenAI client shared by every model call; retries are left to the scheduler.'''
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("API Key not found. Check your .env file.")
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=30,
+            )
+        ),
+    )
+
+
+register("firestore", create_firestore_client)
+register("openai", create_openai_client)
@@ -71,43 +71,112 @@ chatForm.addEventListener('submit', async (e) => {
     chatBox.appendChild(thinkingIndicator);
     chatBox.scrollTop = chatBox.scrollHeight;
 
-    // send to backend
+    // send to backend, asking for a streamed (Server-Sent Events) reply
     const response = await fetch('/chat', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: userMessage })
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ message: userMessage, stream: true })
     });
 
-    chatBox.removeChild(thinkingIndicator);
+    // container for the AI response, added once the first text arrives
+    let outputDiv = null;
+    function ensureOutput() {
+      if (outputDiv) return outputDiv;
+      chatBox.removeChild(thinkingIndicator);
+      const aiContainer = document.createElement('div');
+      aiContainer.className = "flex items-start space-x-2";
+      aiContainer.innerHTML = `
+        <img src="/static/images/tps-logo.webp" alt="AI Logo" class="w-5 h-5 mt-2 rounded shadow-md" />
+        <div id="model-output" class="model-bubble px-4 py-2 rounded-2xl max-w-xl typewriter-output"></div>
+      `;
+      chatBox.appendChild(aiContainer);
+      outputDiv = aiContainer.querySelector('.typewriter-output');
+      return outputDiv;
+    }
 
-    const data = await response.json();
-    const reply = data.response || `<span class="text-red-400">Error:</span> ${data.error}`;
+    function appendText(text) {
+      const div = ensureOutput();
+      div.innerHTML += text.replace(/\n/g, '<br>');
+      chatBox.scrollTop = chatBox.scrollHeight;
+    }
 
-    // typewriter effect for AI response
-    const aiContainer = document.createElement('div');
-    aiContainer.className = "flex items-start space-x-2";
-    aiContainer.innerHTML = `
-      <img src="/static/images/tps-logo.webp" alt="AI Logo" class="w-5 h-5 mt-2 rounded shadow-md" />
-      <div id="model-output" class="model-bubble px-4 py-2 rounded-2xl max-w-xl typewriter-output"></div>
-    `;
-    chatBox.appendChild(aiContainer);
-    chatBox.scrollTop = chatBox.scrollHeight;
+    const contentType = response.headers.get('Content-Type') || '';
+
+    if (response.body && contentType.includes('text/event-stream')) {
+      // render tokens as they arrive instead of waiting for the full reply
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let jobId = null;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+          const dataLine = event.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const payload = JSON.parse(dataLine.slice(6));
+          if (payload.delta) appendText(payload.delta);
+          if (payload.error) appendText(`<span class="text-red-400">Error:</span> ${payload.error}`);
+          if (payload.job_id) jobId = payload.job_id;
+        }
+      }
+      if (!outputDiv) ensureOutput();
+
+      // a queued pitch is graded after the acknowledgment; tell the user if grading gave up
+      if (jobId) {
+        pollJob(`/chat/jobs/${jobId}`).then(job => {
+          if (job.error) appendText(`<br><span class="text-red-400">Error:</span> ${job.error}`);
+        });
+      }
 
-    const outputDiv = aiContainer.querySelector('.typewriter-output');
-    let i = 0;
-    function typeWriter() {
-      if (i < reply.length) {
-        outputDiv.innerHTML += reply[i] === '\n' ? '<br>' : reply[i];
-        i++;
-        chatBox.scrollTop = chatBox.scrollHeight;
-        setTimeout(typeWriter, 15); // adjust typing speed here
+    } else {
+      const data = await response.json();
+      const reply = data.response || `<span class="text-red-400">Error:</span> ${data.error}`;
+
+      // typewriter effect for AI response
+      const typedDiv = ensureOutput();
+      let i = 0;
+      function typeWriter() {
+        if (i < reply.length) {
+          typedDiv.innerHTML += reply[i] === '\n' ? '<br>' : reply[i];
+          i++;
+          chatBox.scrollTop = chatBox.scrollHeight;
+          setTimeout(typeWriter, 15); // adjust typing speed here
+        }
       }
+      typeWriter();
     }
-    typeWriter();
 
     chatBox.scrollTop = chatBox.scrollHeight;
 });
 
+const POLL_TIMEOUT_MS = 5 * 60 * 1000;
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+// polls a grading job until it finishes; resolves to the finished job, or {} if it couldn't be followed
+async function pollJob(statusUrl) {
+    const deadline = Date.now() + POLL_TIMEOUT_MS;
+    let delay = 1000;
+    while (Date.now() < deadline) {
+        await sleep(delay);
+        delay = Math.min(delay * 1.5, 5000);
+        try {
+            const response = await fetch(statusUrl, { cache: 'no-store' });
+            if (!response.ok) return {};
+            const job = await response.json();
+            if (job.status === 'succeeded' || job.status === 'failed') return job;
+        } catch (err) {
+            // a dropped poll is harmless; the job keeps running on the server
+        }
+    }
+    return {};
+}
+
 // mobile placeholder logic
 function setInputPlaceholder() {
     if (window.innerWidth < 768) {
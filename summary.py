@@ -0,0 +1,188 @@
+import os
+import threading
+from datetime import datetime, timezone
+from firestore import (
+    submission_collections,
+    stream_submissions_since,
+    load_summary_state,
+    save_summary_state,
+    load_partial_summary,
+    save_partial_summaries,
+    load_partial_summaries,
+)
+from model import (
+    summarize_feedback,
+    merge_summaries,
+    estimate_tokens,
+    format_submission_for_summary,
+)
+from metrics import stage
+from batch_writer import MAX_BATCH_SIZE
+
+# upper bound on the estimated prompt tokens sent in any single summarization call
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "3000"))
+# days of a domain folded in per refresh, so the changed days and the domain fit in one batched save;
+# any later days are picked up by the next refresh
+MAX_DAYS_PER_REFRESH = MAX_BATCH_SIZE - 1
+
+_refresh_lock = threading.Lock()
+
+
+def get_cached_summary():
+    '''Returns the stored weakness summary and the time it was generated, without refreshing it.'''
+    state = load_summary_state()
+    return state.get("summary", ""), state.get("generated_at")
+
+
+def chunk_by_budget(items, budget=SUMMARY_TOKEN_BUDGET, cost=estimate_tokens):
+    '''Groups consecutive items into chunks whose estimated token total stays within budget.'''
+    chunk, used = [], 0
+
+    for item in items:
+        item_cost = cost(item)
+        if chunk and used + item_cost > budget:
+            yield chunk
+            chunk, used = [], 0
+        chunk.append(item)
+        used += item_cost
+
+    if chunk:
+        yield chunk
+
+
+def submission_day(entry):
+    '''Returns the ISO date a submission was made, used to batch partial summaries.'''
+    timestamp = entry.get("submitted_at")
+    return timestamp.date().isoformat() if timestamp else "unknown"
+
+
+def iter_day_chunks(entries, budget=SUMMARY_TOKEN_BUDGET):
+    '''Yields (day, chunk) pairs of time-ordered submissions, splitting on day changes and the token budget.'''
+    chunk, used, day = [], 0, None
+    entry_cost = lambda entry: estimate_tokens(format_submission_for_summary(entry))
+
+    for entry in entries:
+        entry_day = submission_day(entry)
+        cost = entry_cost(entry)
+        if chunk and (entry_day != day or used + cost > budget):
+            yield day, chunk
+            chunk, used = [], 0
+        chunk.append(entry)
+        used += cost
+        day = entry_day
+
+    if chunk:
+        yield day, chunk
+
+
+def reduce_summaries(summaries, budget=SUMMARY_TOKEN_BUDGET):
+    '''Hierarchically merges summaries in budget-sized groups until one remains. Returns "" on failure.'''
+    summaries = [s for s in summaries if s]
+
+    while len(summaries) > 1:
+        groups = list(chunk_by_budget(summaries, budget))
+        if len(groups) == len(summaries):
+            # every summary fills the budget on its own, so fall back to merging pairs
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+
+        merged = [merge_summaries(group) for group in groups]
+        if not all(merged):
+            return ""
+        summaries = merged
+
+    return summaries[0] if summaries else ""
+
+
+def refresh_domain_summary(domain, col):
+    '''Summarizes a domain's submissions since its checkpoint and folds them into its stored summaries.
+
+    Only the new partial summaries are merged: into the stored summary of the day they fall on, and into
+    the stored domain summary. The changed days are saved in one batch with the domain summary and its
+    advanced checkpoint, so a failure leaves everything as it was and the next refresh redoes the same work.
+    Returns True if the domain changed, False if there was nothing new, and None on failure.
+    '''
+    domain_state = load_partial_summary(domain)
+    checkpoint = domain_state.get("checkpoint")
+    count = domain_state.get("count", 0)
+
+    new_partials = {}
+    new_counts = {}
+    for day, chunk in iter_day_chunks(stream_submissions_since(col, checkpoint)):
+        if day not in new_partials and len(new_partials) >= MAX_DAYS_PER_REFRESH:
+            break
+        partial = summarize_feedback(chunk)
+        if not partial:
+            return None
+        new_partials.setdefault(day, []).append(partial)
+        new_counts[day] = new_counts.get(day, 0) + len(chunk)
+        checkpoint = chunk[-1].get("submitted_at") or checkpoint
+
+    if not new_partials:
+        return False
+
+    states = {}
+    for day, partials in new_partials.items():
+        key = f"{domain}@{day}"
+        day_state = load_partial_summary(key)
+        merged = reduce_summaries([day_state.get("summary", "")] + partials)
+        if not merged:
+            return None
+        states[key] = {
+            "kind": "day",
+            "domain": domain,
+            "day": day,
+            "summary": merged,
+            "count": day_state.get("count", 0) + new_counts[day],
+        }
+
+    new_summaries = [partial for partials in new_partials.values() for partial in partials]
+    domain_summary = reduce_summaries([domain_state.get("summary", "")] + new_summaries)
+    if not domain_summary:
+        return None
+
+    states[domain] = {
+        "kind": "domain",
+        "domain": domain,
+        "summary": domain_summary,
+        "checkpoint": checkpoint,
+        "count": count + sum(new_counts.values()),
+    }
+    save_partial_summaries(states)
+    return True
+
+
+def refresh_weakness_summary():
+    '''Summarizes only submissions newer than each domain's checkpoint and returns (summary, generated_at).
+
+    Falls back to the previously cached summary if any summarization call fails.
+    '''
+    with stage("summarization"), _refresh_lock:
+        changed = False
+
+        for col in submission_collections():
+            try:
+                result = refresh_domain_summary(col.id, col)
+            except Exception as e:
+                print(f"Error refreshing summary for {col.id}: {e}")
+                result = None
+
+            if result is None:
+                return get_cached_summary()
+            changed = changed or result
+
+        state = load_summary_state()
+        if not changed and state:
+            return state.get("summary", ""), state.get("generated_at")
+
+        domains = load_partial_summaries("domain")
+        summary = reduce_summaries(d.get("summary", "") for d in domains)
+        if domains and not summary:
+            return get_cached_summary()
+
+        state = {
+            "summary": summary or "No submissions available.",
+            "generated_at": datetime.now(timezone.utc),
+            "count": sum(d.get("count", 0) for d in domains),
+        }
+        save_summary_state(state)
+        return state["summary"], state["generated_at"]
@@ -0,0 +1,104 @@
+import re
+
+# targets from pitch_assets/framework.yaml and grading.yaml
+MIN_WORDS = 100
+TARGET_MAX_WORDS = 150
+MAX_WORDS = 170
+MIN_GRADE = 3
+MAX_GRADE = 6
+MAX_AVG_SENTENCE_WORDS = 15
+LONG_SENTENCE_WORDS = 25
+
+WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['’][A-Za-z]+)*")
+SENTENCE_RE = re.compile(r"[^.!?]+[.!?]*")
+VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+SECOND_PERSON = {"you", "your", "yours", "yourself", "yourselves", "you're", "you’re", "you'll", "you’ll", "you've", "you’ve", "you'd", "you’d"}
+FIRST_PERSON = {"i", "we", "our", "ours", "us", "my", "me", "mine"}
+BELIEF_RE = re.compile(r"\bwe believe (?:that )?your?\b[^.!?]*[.!?]?", re.IGNORECASE)
+
+
+def count_syllables(word):
+    '''Estimates syllables in a word by counting vowel groups.'''
+    word = word.lower().strip("'’")
+    if len(word) <= 3:
+        return 1
+    if word.endswith("e") and not word.endswith(("le", "ee")):
+        word = word[:-1]
+    return max(1, len(VOWEL_GROUP_RE.findall(word)))
+
+
+def split_sentences(text):
+    '''Splits text into sentences on terminal punctuation.'''
+    return [s.strip() for s in SENTENCE_RE.findall(text) if WORD_RE.search(s)]
+
+
+def compute_text_metrics(text):
+    '''Computes the deterministic pitch metrics: length, reading level, sentence length and perspective.'''
+    words = WORD_RE.findall(text)
+    sentences = split_sentences(text)
+    word_count = len(words)
+    sentence_count = max(len(sentences), 1)
+    syllables = sum(count_syllables(w) for w in words)
+    lowered = [w.lower() for w in words]
+
+    grade = 0.0
+    if word_count:
+        grade = 0.39 * word_count / sentence_count + 11.8 * syllables / word_count - 15.59
+
+    belief = BELIEF_RE.search(text)
+
+    return {
+        "word_count": word_count,
+        "sentence_count": len(sentences),
+        "avg_sentence_words": round(word_count / sentence_count, 1),
+        "longest_sentence_words": max((len(WORD_RE.findall(s)) for s in sentences), default=0),
+        "reading_grade": round(max(grade, 0.0), 1),
+        "you_ratio": round(sum(w in SECOND_PERSON for w in lowered) / word_count, 3) if word_count else 0.0,
+        "first_person_ratio": round(sum(w in FIRST_PERSON for w in lowered) / word_count, 3) if word_count else 0.0,
+        "belief_statement": belief.group(0).strip() if belief else "",
+    }
+
+
+def prescore_feedback(metrics):
+    '''Fills the Belief Statement, Tone, Length and Clarity feedback sections from computed metrics.'''
+    words = metrics["word_count"]
+    if words > MAX_WORDS:
+        length = f"{words} words, over the {MAX_WORDS}-word maximum (target is {MIN_WORDS}–{TARGET_MAX_WORDS})."
+    elif words > TARGET_MAX_WORDS:
+        length = f"{words} words, above the {MIN_WORDS}–{TARGET_MAX_WORDS} word target but within the {MAX_WORDS}-word maximum."
+    elif words < MIN_WORDS:
+        length = f"{words} words, below the {MIN_WORDS}–{TARGET_MAX_WORDS} word target."
+    else:
+        length = f"{words} words, within the {MIN_WORDS}–{TARGET_MAX_WORDS} word target."
+
+    grade = metrics["reading_grade"]
+    if grade > MAX_GRADE:
+        level = f"Reading level is about grade {grade:g}, above the {MIN_GRADE}rd–{MAX_GRADE}th grade target."
+    elif grade < MIN_GRADE:
+        level = f"Reading level is about grade {grade:g}, below the {MIN_GRADE}rd–{MAX_GRADE}th grade target."
+    else:
+        level = f"Reading level is about grade {grade:g}, within the {MIN_GRADE}rd–{MAX_GRADE}th grade target."
+
+    if metrics["you_ratio"] >= metrics["first_person_ratio"] and metrics["you_ratio"] > 0:
+        perspective = f"Written in second person ('you' words are {metrics['you_ratio']:.0%} of the pitch)."
+    else:
+        perspective = "Not written primarily in second person; the pitch focuses on the seller rather than the prospect."
+
+    avg = metrics["avg_sentence_words"]
+    longest = metrics["longest_sentence_words"]
+    if avg > MAX_AVG_SENTENCE_WORDS or longest > LONG_SENTENCE_WORDS:
+        clarity = f"Sentences average {avg:g} words (longest {longest}), which is hard to speak naturally in one breath."
+    else:
+        clarity = f"Sentences average {avg:g} words (longest {longest}), short enough to speak naturally."
+
+    if metrics["belief_statement"]:
+        belief = f"Present: \"{metrics['belief_statement']}\""
+    else:
+        belief = "N/A. The pitch should include a belief statement that starts with \"We believe you...\"."
+
+    return {
+        "Belief Statement": belief,
+        "Tone": f"{level} {perspective}",
+        "Length": length,
+        "Clarity": clarity,
+    }
@@ -1,2 +1,4 @@
 # Vercel's Flask entry point
-from app import app
\ No newline at end of file
+from app import app, start_job_workers
+
+start_job_workers()